@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+    Compares the size and the encode/decode times of the payload codecs for
+    a few typical API responses.  The MessagePack codec is measured with
+    the pure Python implementation and, if installed, the msgpack library.
+
+    Before timing, it checks that all codecs decode every payload to the
+    same value, including the datetimes and UUIDs that are converted by
+    the application's JSON encoder.
+
+    Run it with ``python benchmarks/payload.py``.
+"""
+
+import uuid
+from datetime import datetime
+from timeit import Timer
+
+from flask import payload
+from flask.payload import JSONCodec, MessagePackCodec, CBORCodec
+
+
+PAYLOADS = {
+    'object': {
+        'id': 4211,
+        'name': u'Jane Doe',
+        'email': u'jane@example.com',
+        'active': True,
+        'score': 0.87,
+        'tags': [u'admin', u'beta'],
+        'uuid': uuid.UUID('6f1c2a4e-8a9b-4c3d-9e2f-1a2b3c4d5e6f'),
+        'created': datetime(2014, 3, 1, 12, 30),
+    },
+    'rows': [{'id': i, 'sku': u'sku-%05d' % i, 'quantity': i % 7,
+              'price': 19.99 + i, 'in_stock': i % 3 != 0}
+             for i in range(500)],
+    'numbers': list(range(-5000, 5000, 7)),
+}
+
+NUMBER = 200
+
+
+class PurePythonMessagePackCodec(MessagePackCodec):
+
+    def dumps(self, obj):
+        return payload.packb(obj)
+
+    def loads(self, data):
+        return payload.unpackb(data)
+
+
+def main():
+    codecs = [('json', JSONCodec()),
+              ('msgpack-py', PurePythonMessagePackCodec())]
+    if payload.msgpack is not None:
+        codecs.append(('msgpack', MessagePackCodec()))
+    if payload.cbor2 is not None:
+        codecs.append(('cbor', CBORCodec()))
+    for name, obj in sorted(PAYLOADS.items()):
+        decoded = [(label, codec.loads(codec.dumps(obj)))
+                   for label, codec in codecs]
+        for label, value in decoded[1:]:
+            assert value == decoded[0][1], '%s differs for %s' % (label, name)
+
+    print('%-8s %-11s %8s %12s %12s' % ('payload', 'codec', 'bytes',
+                                        'dumps (us)', 'loads (us)'))
+    for name, obj in sorted(PAYLOADS.items()):
+        for label, codec in codecs:
+            data = codec.dumps(obj)
+            dumps = Timer(lambda: codec.dumps(obj)).timeit(NUMBER)
+            loads = Timer(lambda: codec.loads(data)).timeit(NUMBER)
+            print('%-8s %-11s %8d %12.2f %12.2f' % (
+                name, label, len(data),
+                dumps / NUMBER * 1e6, loads / NUMBER * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+    Compares the time it takes to match requests with werkzeug's url map
+    and with :class:`flask.routing.TrieURLMatcher` for growing numbers of
+    rules.
+
+    Run it with ``python benchmarks/routing.py``.
+"""
+
+import random
+from timeit import default_timer
+
+from werkzeug.routing import Map, Rule
+
+from flask.routing import TrieURLMatcher
+
+
+RULE_COUNTS = (10, 100, 1000, 10000)
+REQUESTS = 2000
+
+
+def make_map(count):
+    rules = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            rules.append(Rule('/section%d/' % i, endpoint='index%d' % i))
+        elif kind == 1:
+            rules.append(Rule('/section%d/item/<int:id>' % i,
+                              endpoint='item%d' % i))
+        elif kind == 2:
+            rules.append(Rule('/section%d/<slug>/edit' % i,
+                              endpoint='edit%d' % i, methods=['POST']))
+        else:
+            rules.append(Rule('/files%d/<path:filename>' % i,
+                              endpoint='files%d' % i))
+    return Map(rules)
+
+
+def make_paths(count):
+    rnd = random.Random(count)
+    rv = []
+    for x in range(REQUESTS):
+        i = rnd.randrange(count)
+        kind = i % 4
+        if kind == 0:
+            rv.append(('/section%d/' % i, 'GET'))
+        elif kind == 1:
+            rv.append(('/section%d/item/%d' % (i, x), 'GET'))
+        elif kind == 2:
+            rv.append(('/section%d/slug-%d/edit' % (i, x), 'POST'))
+        else:
+            rv.append(('/files%d/a/b/%d.txt' % (i, x), 'GET'))
+    return rv
+
+
+def run(match, url_map, paths):
+    start = default_timer()
+    for path, method in paths:
+        adapter = url_map.bind('localhost', path_info=path,
+                               default_method=method)
+        match(adapter)
+    return (default_timer() - start) / len(paths) * 1e6
+
+
+def main():
+    print('%8s %16s %16s %8s' % ('rules', 'werkzeug (us)', 'trie (us)',
+                                 'speedup'))
+    for count in RULE_COUNTS:
+        url_map = make_map(count)
+        paths = make_paths(count)
+        matcher = TrieURLMatcher(url_map)
+        baseline = run(lambda a: a.match(return_rule=True), url_map, paths)
+        trie = run(matcher.match, url_map, paths)
+        print('%8d %16.2f %16.2f %7.1fx' % (count, baseline, trie,
+                                            baseline / trie))
+
+
+if __name__ == '__main__':
+    main()
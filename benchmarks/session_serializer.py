@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+    Compares the :class:`~flask.sessions.TaggedJSONSerializer` with the
+    :class:`~flask.sessions.CompactSessionSerializer` for a few typical
+    session payloads.  Sizes are those of the final signed cookie value.
+
+    Run it with ``python benchmarks/session_serializer.py``.
+"""
+
+import uuid
+from datetime import datetime
+from timeit import Timer
+
+from flask.sessions import TaggedJSONSerializer, CompactSessionSerializer, \
+     SessionSigningSerializer
+
+
+PAYLOADS = {
+    'user id': {
+        'user_id': 4211,
+        '_fresh': True,
+        'csrf_token': uuid.uuid4().hex,
+    },
+    'flash': {
+        'user_id': 4211,
+        '_flashes': [('message', u'Your changes have been saved.'),
+                     ('error', u'The upload of "report.pdf" failed.'),
+                     ('message', u'You have 3 new messages.')],
+    },
+    'cart': {
+        'user_id': 4211,
+        'cart_id': uuid.uuid4(),
+        'cart': [(uuid.uuid4(), 'sku-%05d' % i, i % 3 + 1, 1999 + i)
+                 for i in range(12)],
+        'updated': datetime(2014, 5, 1, 12, 30),
+    },
+}
+
+NUMBER = 2000
+
+
+def make_signer(serializer):
+    return SessionSigningSerializer('secret key', salt='cookie-session',
+                                    serializer=serializer)
+
+
+def main():
+    serializers = [('tagged', TaggedJSONSerializer()),
+                   ('compact', CompactSessionSerializer())]
+    print('%-10s %-8s %8s %12s %12s' % ('payload', 'format', 'bytes',
+                                        'dumps (us)', 'loads (us)'))
+    for name, payload in sorted(PAYLOADS.items()):
+        for label, serializer in serializers:
+            signer = make_signer(serializer)
+            cookie = signer.dumps(payload)
+            dumps = Timer(lambda: signer.dumps(payload)).timeit(NUMBER)
+            loads = Timer(lambda: signer.loads(cookie)).timeit(NUMBER)
+            print('%-10s %-8s %8d %12.2f %12.2f' % (
+                name, label, len(cookie),
+                dumps / NUMBER * 1e6, loads / NUMBER * 1e6))
+
+
+if __name__ == '__main__':
+    main()
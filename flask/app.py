@@ -12,6 +12,7 @@ from threading import lock
 from datetime import timedelta
 from itertools import chain
 from functools import update_wrapper
+from collections import namedtuple, OrderedDict
 
 from werkzeug.datastructures import immutabledict
 from werkzeug.routing import map, rule, requestredirect, builderror
@@ -19,23 +20,39 @@ from werkzeug.exceptions import httpexception, internalservererror, \
      methodnotallowed, badrequest
 
 from .helpers import _packageboundobject, url_for, get_flashed_messages, \
-     locked_cached_property, _endpoint_from_view_func, find_package
+     locked_cached_property, _endpoint_from_view_func, find_package, \
+     LRUCache, StaticFileCache
 from . import json
 from .wrappers import request, response
 from .config import connfigattribute, config
 from .ctx import requestcontext, appcontext, _appctxglobals
 from .globals import _request_ctx_stack, request, session, g
 from .sessions import securecookiesessioninterface
+from .routing import URLMatchCache
+from .payload import get_default_codecs
+from .watcher import TemplateWatcher
+from .static import StaticManifest
 from .templating import dispatchingjinjaloader, environment, \
-     _default_template_ctx_processor
+     _default_template_ctx_processor, FileSystemBytecodeCache, \
+     FragmentCacheExtension, LazyContextProcessor, TemplateStats
 from .signals import request_started, request_finished, got_request_exception, \
      request_tearing, appcontext_tearing_down
-from ._compat import reraise, string_types, text_type, integer_types
+from ._compat import reraise, string_types, text_type, integer_types, \
+     iteritems
 
 # a lock used for logger initialization
 _logger_lock = locker()
 
 
+#: the per-endpoint request hook pipeline compiled by
+#: :meth:`Flask._compile_request_hooks`.  `after_request` and
+#: `teardown_request` are already in the order they have to be called in.
+_RequestHooks = namedtuple('_RequestHooks', ['url_value_preprocessors',
+                                             'before_request',
+                                             'after_request',
+                                             'teardown_request'])
+
+
 def _make_timedelta(value):
     if not isinstance(value, timedelta):
         return timedelta(seconds=value)
@@ -55,7 +72,10 @@ def setupmethod(f):
                 'to fix this make sure to import all your view modules, '
                 'database models and everything related at a central place '
                 'before the application starts serving requests.')
-        return f(self, *args, **kwargs)
+        rv = f(self, *args, **kwargs)
+        if self._request_hooks is not None:
+            self._invalidate_request_hooks()
+        return rv
     return update_wrapper(wrapper_func, f)
 
 
@@ -86,6 +106,9 @@ class flask(_packageboundobject):
     json_encoder = json.jsonencoder
     json_decoder = json.jsondecoder
 
+    #: the class that is used for :attr:`json_provider`.
+    json_provider_class = json.JSONProvider
+
     jinja_options = immutabledict(
         extensions=['jinja2.ext.autoescape', 'jinja2.ext.with_']
     )
@@ -116,9 +139,32 @@ class flask(_packageboundobject):
         'json_as_ascii':                        true,
         'json_sort_keys':                       true,
         'jsonify_prettyprint_regular':          true,
+        'SECRET_KEYS':                          None,
+        'JSON_BACKEND':                         None,
+        'JINJA_BYTECODE_CACHE':                 False,
+        'FRAGMENT_CACHE_SIZE':                  1024,
+        'FRAGMENT_CACHE_TIMEOUT':               300,
+        'TEMPLATE_STREAM_BUFFER_SIZE':          5,
+        'TEMPLATE_STATS':                       False,
+        'TEMPLATES_WATCH':                      False,
+        'TEMPLATES_WATCH_INTERVAL':             1.0,
+        'STATIC_FILE_CACHE_SIZE':               1024,
+        'STATIC_FILE_CACHE_TIMEOUT':            2,
+        'STATIC_FILE_CACHE_WATCH':              False,
+        'STATIC_FILE_CACHE_MISSES':             False,
+        'SEND_FILE_PRECOMPRESSED':              True,
+        'STATIC_MANIFEST':                      None,
+        'JSONIFY_STREAM_CHUNK_SIZE':            8192,
+        'URL_MATCH_CACHE_SIZE':                 None,
     })
     
     url_rule_class = rule
+
+    #: the class used to match requests against the url map, for example
+    #: :class:`~flask.routing.TrieURLMatcher`.  If this is `None` the url
+    #: adapter does the matching.
+    url_matcher_class = None
+
     test_client_class = none
     session_interface = securecookiesessioninterface()
 
@@ -149,6 +195,15 @@ class flask(_packageboundobject):
 
         self.error_handler_spec = {none: self._error_handlers}
 
+        # error handlers resolved by :meth:`_find_error_handler` keyed by
+        # ``(blueprint, code_or_exception_class)``.
+        self._error_handler_cache = {}
+
+        #: the :class:`~flask.watcher.TemplateWatcher` that keeps the
+        #: template cache up to date if ``TEMPLATES_WATCH`` is enabled.  It
+        #: is started with the first request.
+        self.template_watcher = None
+
         self.url_build_error_handlers = []
 
         self.before_request_funcs = {}
@@ -173,6 +228,13 @@ class flask(_packageboundobject):
         self._got_first_request = false
         self._before_request_lock = lock()
 
+        # compiled request hook pipelines keyed by blueprint name.  these
+        # are built when the first request is handled and dropped again
+        # whenever a setup method is called afterwards.  they have their
+        # own lock as before_first_request functions might issue requests.
+        self._request_hooks = None
+        self._request_hooks_lock = lock()
+
         if self.has_static_folder:
             self.add_url_rule(self.static_url_path + '/<path:filename>',
                               endpoint='static',
@@ -222,6 +284,87 @@ class flask(_packageboundobject):
     def jinja_env(self):
         return self.create_jinja_environment()
 
+    @locked_cached_property
+    def json_provider(self):
+        """The :class:`~flask.json.JSONProvider` that encodes and decodes
+        JSON for this application.  It reads the JSON related config keys
+        when it is created.
+        """
+        return self.json_provider_class(self)
+
+    @locked_cached_property
+    def static_file_cache(self):
+        """The :class:`~flask.helpers.StaticFileCache` used by
+        :func:`~flask.send_file` or `None` if ``STATIC_FILE_CACHE_SIZE``
+        is `0`.  Entries expire after ``STATIC_FILE_CACHE_TIMEOUT``
+        seconds.  If ``STATIC_FILE_CACHE_WATCH`` is enabled and inotify is
+        available the static folders are watched instead.  Paths that are
+        not files are only cached in watched folders, unless
+        ``STATIC_FILE_CACHE_MISSES`` is enabled.
+        """
+        return self.create_static_file_cache()
+
+    @locked_cached_property
+    def static_manifest(self):
+        """The :class:`~flask.static.StaticManifest` with fingerprinted
+        names for the static files or `None` if ``STATIC_MANIFEST`` is not
+        set.  A filename (relative to the instance folder) loads a manifest
+        written by :meth:`build_static_manifest`.
+
+        If it is `True` the manifest is built from the static folders when
+        it is first used, which hashes all static files during the first
+        :func:`~flask.url_for` call for a static file.  It is not built
+        again when files change; changed files are then served without
+        the long cache time until the application is restarted.  This is
+        meant for development, deployments should build the manifest in
+        advance.
+        """
+        return self.create_static_manifest()
+
+    @locked_cached_property
+    def template_stats(self):
+        """The :class:`~flask.templating.TemplateStats` with render and
+        load times of the templates if ``TEMPLATE_STATS`` is enabled,
+        otherwise `None`.
+        """
+        return self.create_template_stats()
+
+    @locked_cached_property
+    def fragment_cache(self):
+        """The cache for the ``{% cache %}`` template blocks.  By default
+        a :class:`~flask.helpers.LRUCache` with ``FRAGMENT_CACHE_SIZE``
+        entries that expire after ``FRAGMENT_CACHE_TIMEOUT`` seconds.  Any
+        object with the same `get`, `set`, `delete` and `clear` methods can
+        be returned from :meth:`create_fragment_cache` instead, for example
+        to share fragments between processes.
+        """
+        return self.create_fragment_cache()
+
+    @locked_cached_property
+    def payload_codecs(self):
+        """An ordered mapping of mimetypes to the
+        :class:`~flask.payload.PayloadCodec` objects used for dicts and
+        lists returned from views and by
+        :meth:`~flask.Request.get_payload`.  The first codec is the one
+        used when the client does not state a preference.
+        """
+        return self.create_payload_codecs()
+
+    @locked_cached_property
+    def url_match_cache(self):
+        """The :class:`~flask.routing.URLMatchCache` used to match
+        requests or `None` if ``URL_MATCH_CACHE_SIZE`` is not set.  Its
+        `hits` and `misses` counters can be used to tune the size.
+        """
+        return self.create_url_match_cache()
+
+    @locked_cached_property
+    def url_matcher(self):
+        """The matcher created from :attr:`url_matcher_class`.  It is
+        rebuilt after the url map changed.
+        """
+        return self.create_url_matcher()
+
     @property
     def got_first_request(self):
         return self._got_first_request
@@ -245,6 +388,8 @@ class flask(_packageboundobject):
         options = dict(self.jinja_options)
         if 'autoescape' not in options:
             options['autoescape'] = self.select_jinja_autoescape
+        if 'bytecode_cache' not in options:
+            options['bytecode_cache'] = self.create_jinja_bytecode_cache()
         rv = Environment(self, **options)
         rv.globals.update(
             url_for=url_for,
@@ -255,8 +400,151 @@ class flask(_packageboundobject):
             g=g
         )
         rv.filters['tojson'] = json.tojson_filter
+        rv.add_extension(FragmentCacheExtension)
+        return rv
+
+    def create_jinja_bytecode_cache(self):
+        """Creates the bytecode cache for the Jinja environment if
+        ``JINJA_BYTECODE_CACHE`` is enabled.  If it is `True` compiled
+        templates are stored in the ``jinja-bytecode`` folder of the
+        instance folder, a string is used as folder name instead.
+        """
+        value = self.config['JINJA_BYTECODE_CACHE']
+        if not value:
+            return None
+        if value is True:
+            value = 'jinja-bytecode'
+        return FileSystemBytecodeCache(os.path.join(self.instance_path,
+                                                    value))
+
+    def precompile_templates(self, extensions=None, filter_func=None):
+        """Compiles all templates the loader knows about into the bytecode
+        cache, usually once at deploy time so that new workers do not have
+        to compile them.  `extensions` and `filter_func` select templates
+        like :meth:`jinja2.Environment.list_templates`.  Returns the names
+        of the compiled templates.
+        """
+        env = self.jinja_env
+        if env.bytecode_cache is None:
+            raise RuntimeError('Precompiling templates requires the '
+                               'JINJA_BYTECODE_CACHE to be enabled.')
+        rv = env.list_templates(extensions, filter_func)
+        for name in rv:
+            env.get_template(name)
         return rv
 
+    def create_template_watcher(self):
+        """Creates the template watcher if ``TEMPLATES_WATCH`` is enabled.
+        `True` uses inotify where available and polls the template folders
+        every ``TEMPLATES_WATCH_INTERVAL`` seconds otherwise, ``'poll'``
+        always polls.
+        """
+        value = self.config['TEMPLATES_WATCH']
+        if not value:
+            return None
+        interval = self.config['TEMPLATES_WATCH_INTERVAL']
+        return TemplateWatcher(self, self.jinja_env,
+                               use_inotify=value != 'poll',
+                               interval=interval)
+
+    def create_static_file_cache(self):
+        size = self.config['STATIC_FILE_CACHE_SIZE']
+        if size:
+            return StaticFileCache(size,
+                                   self.config['STATIC_FILE_CACHE_TIMEOUT'],
+                                   self.config['STATIC_FILE_CACHE_MISSES'])
+
+    def create_static_manifest(self):
+        value = self.config['STATIC_MANIFEST']
+        if not value:
+            return None
+        if value is True:
+            return StaticManifest.build(self.iter_static_folders())
+        return StaticManifest.load(os.path.join(self.instance_path, value))
+
+    def build_static_manifest(self, filename=None, threads=None):
+        """Builds a manifest of the static folders, for example as a
+        build step, and writes it to `filename` if given.  Like
+        ``STATIC_MANIFEST``, relative filenames are relative to the
+        instance folder, so setting ``STATIC_MANIFEST`` to the same
+        filename uses the manifest.
+
+        :param filename: the file to write the manifest to.
+        :param threads: the number of threads that hash the files.
+        """
+        rv = StaticManifest.build(self.iter_static_folders(), threads)
+        if filename is not None:
+            rv.save(os.path.join(self.instance_path, filename))
+        return rv
+
+    def iter_static_folders(self):
+        """Yields the static endpoints and folders of the application and
+        all blueprints whose folder exists.
+        """
+        if self.has_static_folder and os.path.isdir(self.static_folder):
+            yield 'static', self.static_folder
+        for name, blueprint in iteritems(self.blueprints):
+            if blueprint.has_static_folder and \
+               os.path.isdir(blueprint.static_folder):
+                yield name + '.static', blueprint.static_folder
+
+    def get_static_folders(self):
+        """Returns the static folders of the application and all
+        blueprints that exist.
+        """
+        return [folder for endpoint, folder in self.iter_static_folders()]
+
+    def create_template_stats(self):
+        if self.config['TEMPLATE_STATS']:
+            return TemplateStats()
+
+    def create_fragment_cache(self):
+        return LRUCache(self.config['FRAGMENT_CACHE_SIZE'],
+                        self.config['FRAGMENT_CACHE_TIMEOUT'])
+
+    def invalidate_template_fragment(self, key):
+        """Removes the fragment cached under `key` so that the next
+        template that uses it renders the block again.
+        """
+        if isinstance(key, list):
+            key = tuple(key)
+        self.fragment_cache.delete(key)
+
+    def create_payload_codecs(self):
+        rv = OrderedDict()
+        for codec in get_default_codecs():
+            for mimetype in codec.mimetypes:
+                rv.setdefault(mimetype, codec)
+        return rv
+
+    def select_payload_codec(self, accept_mimetypes):
+        """Returns the payload codec that fits the client's ``Accept``
+        header best.  Falls back to the first codec.
+        """
+        codecs = self.payload_codecs
+        mimetype = accept_mimetypes.best_match(list(codecs))
+        if mimetype is None:
+            return next(iter(codecs.values()))
+        return codecs[mimetype]
+
+    def make_payload_response(self, obj):
+        """Creates a response for a dict or list returned from a view in
+        the encoding the client prefers.
+        """
+        codec = self.select_payload_codec(request.accept_mimetypes)
+        rv = self.response_class(codec.dumps(obj), mimetype=codec.mimetype)
+        rv.vary.add('Accept')
+        return rv
+
+    def create_url_match_cache(self):
+        size = self.config['URL_MATCH_CACHE_SIZE']
+        if size:
+            return URLMatchCache(size)
+
+    def create_url_matcher(self):
+        if self.url_matcher_class is not None:
+            return self.url_matcher_class(self.url_map)
+
     def create_global_jinja_loader(self):
         return DispatchingJinjaLoader(self)
 
@@ -274,7 +562,10 @@ class flask(_packageboundobject):
                 funcs = chain(funcs, self.template_context_processors[bp])
         orig_ctx = context.copy()
         for func in funcs:
-            context.update(func())
+            if isinstance(func, LazyContextProcessor):
+                context.update(func.bind())
+            else:
+                context.update(func())
         context.update(orig_ctx)
 
     def run(self, host=None, port=None, debug=None, **options):
@@ -324,6 +615,7 @@ class flask(_packageboundobject):
             self.blueprints[blueprint.name] = blueprint
             first_registration = True
         blueprint.register(self, options, first_registration)
+        self._url_map_changed()
 
     @setupmethod
     def add_url_rule(self, rule, endpoint=None, view_func=None, **options):
@@ -352,6 +644,7 @@ class flask(_packageboundobject):
         rule.provide_automatic_options = provide_automatic_options
 
         self.url_map.add(rule)
+        self._url_map_changed()
         if view_func is not None:
             old_func = self.view_functions.get(endpoint)
             if old_func is not None and old_func != view_func:
@@ -359,6 +652,12 @@ class flask(_packageboundobject):
                                      'existing endpoint func: %s' % endpoint
             self.view_functions[endpoint] = view_func
     
+    def _url_map_changed(self):
+        self.__dict__.pop('url_matcher', None)
+        cache = self.__dict__.get('url_match_cache')
+        if cache is not None:
+            cache.clear()
+
     def route(self, rule, **options):
         def decorator(f):
             endpoint = options.pop('endpoint', None)
@@ -395,6 +694,7 @@ class flask(_packageboundobject):
         else:
             self.error_handler_spec.setdefault(key, {}).setdefault(None, []) \
                 .append((code_or_exception, f))
+        self._error_handler_cache.clear()
     
     @setupmethod
     def template_filter(self, name=None):
@@ -458,6 +758,26 @@ class flask(_packageboundobject):
         self.template_context_processors[None].append(f)
         return f
 
+    @setupmethod
+    def lazy_context_processor(self, *names):
+        """Registers a context processor that provides the given `names`.
+        Unlike with :meth:`context_processor` the function is only called
+        if the rendered template looks up one of these names::
+
+            @app.lazy_context_processor('categories')
+            def inject_categories():
+                return {'categories': Category.query.all()}
+
+        If :data:`~flask.template_rendered` has receivers, they get the
+        values of all names, so the function is called for every template
+        in that case.
+        """
+        def decorator(f):
+            self.template_context_processors[None].append(
+                LazyContextProcessor(f, names))
+            return f
+        return decorator
+
     @setupmethod
     def url_value_preprocessor(self, f):
         self.url_value_preprocessors.setdefault(None, []).append(f)
@@ -468,14 +788,38 @@ class flask(_packageboundobject):
         self.url_default_functions.setdefault(None, []).append(f)
         return f
 
+    def _find_error_handler(self, bp, code_or_exception):
+        """Returns the error handler registered for a status code or an
+        exception class in the given blueprint or on the application, or
+        `None`.  The result is cached until another error handler is
+        registered, so repeated errors cost one dict lookup.
+        """
+        key = (bp, code_or_exception)
+        try:
+            return self._error_handler_cache[key]
+        except KeyError:
+            pass
+
+        blueprint_handlers = self.error_handler_spec.get(bp) or {}
+        app_handlers = self.error_handler_spec[None]
+        handler = None
+        if isinstance(code_or_exception, integer_types):
+            handler = blueprint_handlers.get(code_or_exception)
+            if handler is None:
+                handler = app_handlers.get(code_or_exception)
+        else:
+            for typecheck, func in chain(blueprint_handlers.get(None, ()),
+                                         app_handlers.get(None, ())):
+                if issubclass(code_or_exception, typecheck):
+                    handler = func
+                    break
+        self._error_handler_cache[key] = handler
+        return handler
+
     def handle_http_exception(self, e):
-        handlers = self.error_handler_spec.get(request.blueprint)
         if e.code is None:
             return e
-        if handlers and e.code in handlers:
-            handler = handlers[e.code]
-        else:
-            handler = self.error_handler_spec[None].get(e.code)
+        handler = self._find_error_handler(request.blueprint, e.code)
         if handler is None:
             return e
         return handler(e)
@@ -494,15 +838,10 @@ class flask(_packageboundobject):
         if isinstance(e, HTTPException) and not self.trap_http_exception(e):
             return self.handle_http_exception(e)
 
-        blueprint_handlers = ()
-        handlers = self.error_handler_spec.get(request.blueprint)
-        if handlers is not None:
-            blueprint_handlers = handlers.get(None, ())
-        app_handlers = self.error_handler._spec[None].get(None, ())
-        for typecheck, handler in chain(blueprint_handlers, app_handlers):
-            if isinstance(e, typecheck):
-                return handler(e)
-        reraise(exc_type, exc_value, tb)
+        handler = self._find_error_handler(request.blueprint, type(e))
+        if handler is None:
+            reraise(exc_type, exc_value, tb)
+        return handler(e)
 
     def handle_exception(self, e):
         exc_type, exc_value, tb = sys.exc_info()
@@ -569,6 +908,74 @@ class flask(_packageboundobject):
             self._got_first_request = True
             for func in self.before_first_request_funcs:
                 func()
+            with self._request_hooks_lock:
+                self._compile_request_hooks()
+            watcher = self.create_template_watcher()
+            if watcher is not None and watcher.start():
+                self.template_watcher = watcher
+            if self.config['STATIC_FILE_CACHE_WATCH'] and \
+               self.static_file_cache is not None:
+                self.static_file_cache.watch(self.get_static_folders())
+
+    def _build_request_hooks(self, bp):
+        def collect(funcs, reverse=False):
+            app_funcs = tuple(funcs.get(None, ()))
+            bp_funcs = ()
+            if bp is not None:
+                bp_funcs = tuple(funcs.get(bp, ()))
+            if reverse:
+                return app_funcs[::-1], bp_funcs[::-1]
+            return app_funcs, bp_funcs
+
+        app_funcs, bp_funcs = collect(self.url_value_preprocessors)
+        url_value_preprocessors = app_funcs + bp_funcs
+        app_funcs, bp_funcs = collect(self.before_request_funcs)
+        before_request = app_funcs + bp_funcs
+        app_funcs, bp_funcs = collect(self.after_request_funcs, reverse=True)
+        after_request = bp_funcs + app_funcs
+        app_funcs, bp_funcs = collect(self.teardown_request_funcs,
+                                      reverse=True)
+        teardown_request = app_funcs + bp_funcs
+        return _RequestHooks(url_value_preprocessors, before_request,
+                             after_request, teardown_request)
+
+    def _compile_request_hooks(self):
+        """Flattens the registered request hooks into one tuple of
+        callables per phase and attaches the result to every url rule
+        so that requests can dispatch straight from it.
+        """
+        pipelines = {None: self._build_request_hooks(None)}
+        for rule in self.url_map.iter_rules():
+            bp = None
+            if '.' in rule.endpoint:
+                bp = rule.endpoint.rsplit('.', 1)[0]
+            hooks = pipelines.get(bp)
+            if hooks is None:
+                hooks = pipelines[bp] = self._build_request_hooks(bp)
+            rule.request_hooks = hooks
+        self._request_hooks = pipelines
+
+    def _invalidate_request_hooks(self):
+        self._request_hooks = None
+        for rule in self.url_map.iter_rules():
+            rule.request_hooks = None
+
+    def _get_request_hooks(self, request):
+        rule = request.url_rule
+        if rule is not None:
+            hooks = getattr(rule, 'request_hooks', None)
+            if hooks is not None:
+                return hooks
+        pipelines = self._request_hooks
+        if pipelines is None:
+            with self._request_hooks_lock:
+                if self._request_hooks is None:
+                    self._compile_request_hooks()
+                pipelines = self._request_hooks
+        hooks = pipelines.get(request.blueprint)
+        if hooks is None:
+            hooks = pipelines[None]
+        return hooks
     
     def make_default_options_response(self):
         adapter = _request_ctx_stack.top.url_adapter
@@ -601,6 +1008,8 @@ class flask(_packageboundobject):
             if isinstance(rv, (text_type, bytes, bytearray)):
                 rv = self.response_class(rv, headers=headers, status=status)
                 headers = status = None
+            elif isinstance(rv, (dict, list)):
+                rv = self.make_payload_response(rv)
             else:
                 rv = self.response_class.force_type(rv, request.environ)
 
@@ -623,6 +1032,23 @@ class flask(_packageboundobject):
                 script_name=self.config['APPLICATION_ROOT'] or '/',
                 url_scheme=self.config['PREFERRED_URL_SCHEME'])
     
+    def match_url(self, url_adapter):
+        """Matches the request the url adapter is bound to and returns a
+        ``(rule, view_args)`` tuple.  Routing failures are raised as
+        :exc:`~werkzeug.exceptions.HTTPException`.  If a url match cache
+        is configured it is consulted first.
+        """
+        cache = self.url_match_cache
+        if cache is not None:
+            return cache.match(url_adapter, self._match_url)
+        return self._match_url(url_adapter)
+
+    def _match_url(self, url_adapter):
+        matcher = self.url_matcher
+        if matcher is not None:
+            return matcher.match(url_adapter)
+        return url_adapter.match(return_rule=True)
+
     def inject_url_defaults(self, endpoint, values):
         funcs = self.url_default_functions.get(None, ())
         if '.' in endpoint:
@@ -630,6 +1056,11 @@ class flask(_packageboundobject):
             funcs = chain(funcs, self.url_default_functions.get(bp, ()))
         for func in funcs:
             func(endpoint, values)
+        if 'filename' in values and \
+           (endpoint == 'static' or endpoint.endswith('.static')):
+            manifest = self.static_manifest
+            if manifest is not None:
+                values['filename'] = manifest.get(endpoint, values['filename'])
 
     def handle_url_build_error(self, error, endpoint, values):
         exc_type, exc_value, tb = sys.exc_info()
@@ -646,43 +1077,32 @@ class flask(_packageboundobject):
         raise error
 
     def preprocess_request(self):
-        bp = _request_ctx_stack.top.request.blueprint
-        funcs = self.url_value_preprocessors.get(None, ())
-        if bp is not None and bp in self.url_value_preprocessors:
-            funcs = chain(funcs, self.url_value_preprocessors[bp])
-        for func in funcs:
-            func(request.endpoint, request.view_args)
+        req = _request_ctx_stack.top.request
+        hooks = self._get_request_hooks(req)
+        for func in hooks.url_value_preprocessors:
+            func(req.endpoint, req.view_args)
 
-        funcs = self.before_request_funcs.get(None, ())
-        if bp is not None and bp in self.before_request_funcs:
-            funcs = chain(funcs, self.before_request_funcs[bp])
-        for func in funcs:
+        for func in hooks.before_request:
             rv = func()
             if rv is not None:
                 return rv
     
     def process_response(self, response):
         ctx = _request_ctx_stack.top
-        bp = ctx.request.blueprint
-        funcs = ctx._after_request_functions
-        if bp is not None and bp in self.after_request_funcs:
-            funcs = chain(funcs, reversed(self.after_request_funcs[bp]))
-        if None in self.after_request_funcs:
-            funcs = chain(funcs, reversed(self.after_request_funcs[None]))
-        for handler in funcs:
+        for handler in ctx._after_request_functions:
+            response = handler(response)
+        for handler in self._get_request_hooks(ctx.request).after_request:
             response = handler(response)
-        if not self.session_interface.is_null_session(ctx.session):
+        if ctx.session_loaded and \
+           not self.session_interface.is_null_session(ctx.session):
             self.save_session(ctx.session, response)
         return response
 
     def do_teardown_request(self, exc=None):
         if exc is None:
             exc = sys.exc_info()[1]
-        funcs = reversed(self.teardown_request_funcs.get(None, ()))
-        bp = _request_ctx_stack.top.request.blueprint
-        if bp is not None and bp in self.teardown_request_funcs:
-            funcs = chain(funcs, reversed(self.teardown_request_funcs[bp]))
-        for func in funcs:
+        req = _request_ctx_stack.top.request
+        for func in self._get_request_hooks(req).teardown_request:
             func(exc)
         request_tearing_down.send(self, exc=exc)
     
@@ -9,6 +9,7 @@
 from functools import update_wrapper
 
 from .helpers import _PackageBoundObject, _endpoint_from_view_func
+from .templating import LazyContextProcessor
 
 
 class BlueprintSetupState(object):
@@ -266,6 +267,29 @@ class Blueprint(_PackageBoundObject):
             .setdefault(None, []).append(f))
         return f
 
+    def lazy_context_processor(self, *names):
+        """Like :meth:`Flask.lazy_context_processor` but for a blueprint.
+        This function is only executed for requests handled by a blueprint.
+        """
+        def decorator(f):
+            processor = LazyContextProcessor(f, names)
+            self.record_once(lambda s: s.app.template_context_processors
+                .setdefault(self.name, []).append(processor))
+            return f
+        return decorator
+
+    def app_lazy_context_processor(self, *names):
+        """Like :meth:`Flask.lazy_context_processor` but for a blueprint.
+        Such a function is executed each request, even if outside of the
+        blueprint.
+        """
+        def decorator(f):
+            processor = LazyContextProcessor(f, names)
+            self.record_once(lambda s: s.app.template_context_processors
+                .setdefault(None, []).append(processor))
+            return f
+        return decorator
+
     def app_errorhandler(self, code):
         """Like :meth:`Flask.errorhandler` but for a blueprint.  This
         handler is used for all requests, even if outside of the blueprint.
@@ -107,7 +107,7 @@ class RequestContext(object):
         self.request = request
         self.url_adapter = app.create_url_adapter(self.request)
         self.flashes = None
-        self.session = None
+        self._session = None
 
         self._implicit_app_ctx_stack = []
 
@@ -126,6 +126,25 @@ class RequestContext(object):
     g = property(_get_g, _set_g)
     del _get_g, _set_g
 
+    def _get_session(self):
+        # the session is opened on first access so that requests which
+        # never use it do not pay for loading and verifying the cookie.
+        if self._session is None:
+            session = self.app.open_session(self.request)
+            if session is None:
+                session = self.app.make_null_session()
+            self._session = session
+        return self._session
+    def _set_session(self, value):
+        self._session = value
+    session = property(_get_session, _set_session)
+    del _get_session, _set_session
+
+    @property
+    def session_loaded(self):
+        """`True` if the session was opened during this request."""
+        return self._session is not None
+
     def copy(self):
         return self.__class__(self.app,
             environ=self.request.environ,
@@ -135,7 +154,7 @@ class RequestContext(object):
     def match_request(self):
         try:
             url_rule, self.request.view_args = \
-                self.url_adapter.match(return_rule=True)
+                self.app.match_url(self.url_adapter)
             self.request.url_rule = url_rule
         except HTTPException as e:
             self.request.routing_exception = e
@@ -158,10 +177,6 @@ class RequestContext(object):
 
         _request_ctx_stack.push(self)
 
-        self.session = self.app.open_session(self.request)
-        if self.session is None:
-            self.session = self.app.make_null_session()
-
     def pop(self, exc=None):
         app_ctx = self._implicit_app_ctx_stack.pop()
 
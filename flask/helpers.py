@@ -7,14 +7,22 @@
 """
 
 import os
+import re
 import sys
+import uuid
 import pkgutil
 import posixpath
 import mimetypes
+from stat import S_ISREG
 from time import time
 from zlib import adler32
-from threading import RLock
+from threading import RLock, Lock, Thread, Event, Semaphore
 from functools import update_wrapper
+from collections import OrderedDict, namedtuple
+try:
+    from queue import Queue, Empty, Full
+except ImportError:
+    from Queue import Queue, Empty, Full
 
 try:
     from werkzeug.urls import url_quote
@@ -24,6 +32,7 @@ except:
 from werkzeug.routing import BuildError
 from werkzeug.datastructures import Headers
 from werkzeug.exceptions import NotFound
+from werkzeug.http import parse_range_header, parse_date, unquote_etag
 
 # this was moved in 0.7
 try:
@@ -36,6 +45,7 @@ from jinja2 import FileSystemLoader
 from .signals import message_flashed
 from .globals import session, _request_ctx_stack, _app_ctx_stack, \
      current_app, request
+from ._compat import reraise, string_types, text_type
 
 
 # sentinel
@@ -101,6 +111,269 @@ def stream_with_context(generator_or_function):
     return wrapped_g
 
 
+# marks the end of a stream in the queue of a background producer
+_stream_end = object()
+
+# the number of background threads that may produce records for streams
+# with heartbeats at the same time.  Further streams are sent without
+# heartbeats.
+_producer_slots = Semaphore(64)
+
+
+def _iter_records(iterable, encode):
+    try:
+        for item in iterable:
+            yield encode(item)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+
+def _iter_in_context(reqctx, records):
+    try:
+        if reqctx is None:
+            for record in records:
+                yield record
+        else:
+            with reqctx:
+                for record in records:
+                    yield record
+    finally:
+        records.close()
+
+
+def _stream_records(iterable, encode, buffer_size=None, heartbeat=None,
+                    heartbeat_interval=None):
+    """Returns the body of a streamed response that yields every item of
+    `iterable` encoded with `encode`.  Without a `heartbeat_interval` the
+    iterable is consumed in the thread of the server under
+    :func:`stream_with_context`, so closing the response (which the server
+    does when the client goes away) closes `iterable` right away.
+    Otherwise it runs in a background thread, see :func:`_iter_produced`.
+    """
+    if heartbeat_interval is not None:
+        return _iter_produced(iterable, encode, buffer_size, heartbeat,
+                              heartbeat_interval)
+    rv = _iter_records(iterable, encode)
+    if _request_ctx_stack.top is not None:
+        rv = stream_with_context(rv)
+    return rv
+
+
+def _iter_produced(iterable, encode, buffer_size, heartbeat,
+                   heartbeat_interval):
+    """Iterates over `iterable` in a background thread that runs in a copy
+    of the current request context and encodes every item with `encode`.
+    The returned generator yields each record as soon as it is available
+    and joins all records that are already waiting into a single chunk.
+    `heartbeat` is yielded whenever no record arrived for
+    `heartbeat_interval` seconds.
+
+    Closing the generator stops the producer after its current item and
+    closes `iterable`.  A producer that is blocked waiting for its next
+    item only notices this once the item arrives, so at most 64 of them
+    run at a time; if all are in use the iterable is consumed in the
+    server's thread without heartbeats.
+    """
+    queue = Queue(buffer_size)
+    stop = Event()
+    reqctx = _request_ctx_stack.top
+    if reqctx is not None:
+        reqctx = reqctx.copy()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(encode(item)):
+                    break
+        except Exception:
+            put(sys.exc_info())
+        else:
+            put(_stream_end)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    def run():
+        try:
+            if reqctx is None:
+                return produce()
+            with reqctx:
+                produce()
+        finally:
+            _producer_slots.release()
+
+    def generate():
+        if not _producer_slots.acquire(False):
+            for record in _iter_in_context(
+                    reqctx, _iter_records(iterable, encode)):
+                yield record
+            return
+        thread = Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        try:
+            while 1:
+                try:
+                    records = [queue.get(timeout=heartbeat_interval)]
+                except Empty:
+                    yield heartbeat
+                    continue
+                while len(records) < buffer_size:
+                    try:
+                        records.append(queue.get_nowait())
+                    except Empty:
+                        break
+                end = records[-1]
+                if end is _stream_end or isinstance(end, tuple):
+                    records.pop()
+                    if records:
+                        yield u''.join(records)
+                    if end is not _stream_end:
+                        reraise(*end)
+                    return
+                yield u''.join(records)
+        finally:
+            stop.set()
+
+    return generate()
+
+
+def _streamed_response(generator, mimetype):
+    rv = current_app.response_class(generator, mimetype=mimetype)
+    rv.headers['Cache-Control'] = 'no-cache'
+    # ask proxies like nginx not to buffer the records
+    rv.headers['X-Accel-Buffering'] = 'no'
+    return rv
+
+
+def stream_ndjson(iterable):
+    """Returns a response that streams every item of `iterable` as one
+    line of JSON (``application/x-ndjson``)::
+
+        @app.route('/logs')
+        def logs():
+            return stream_ndjson(tail_log_records())
+
+    The iterable is consumed while the response is sent, with the request
+    context kept around like with :func:`stream_with_context`, and every
+    record is sent as soon as it is produced.  When the client goes away
+    the server closes the response, which closes the iterable.
+
+    :param iterable: the records to send, usually a generator.
+    """
+    dumps = current_app.json_provider.dumps
+    return _streamed_response(_stream_records(
+        iterable, lambda item: dumps(item) + u'\n'),
+        'application/x-ndjson')
+
+
+_sse_line_re = re.compile(r'\r\n|\r|\n')
+
+# a comment line that clients ignore
+_sse_heartbeat = u':\n\n'
+
+
+class ServerSentEvent(object):
+    """An event for :func:`stream_events`.  Items of the stream that are
+    not events are sent as unnamed events with just the data.
+
+    :param data: the data of the event.  Strings are sent as they are,
+                 everything else is encoded as JSON.
+    :param event: the optional name of the event.
+    :param id: the optional id of the event.
+    :param retry: the optional reconnection time in milliseconds.
+    """
+
+    def __init__(self, data, event=None, id=None, retry=None):
+        self.data = data
+        self.event = event
+        self.id = id
+        self.retry = retry
+
+    def encode(self, dumps):
+        """Returns the event in the text/event-stream format.  Raises a
+        :exc:`ValueError` if the name or id contain a line break.
+        """
+        lines = []
+        for field in 'event', 'id':
+            value = getattr(self, field)
+            if value is None:
+                continue
+            value = text_type(value)
+            if u'\r' in value or u'\n' in value:
+                raise ValueError('The %s field must not contain line '
+                                 'breaks' % field)
+            lines.append(u'%s: %s' % (field, value))
+        if self.retry is not None:
+            lines.append(u'retry: %d' % self.retry)
+        data = self.data
+        if not isinstance(data, string_types):
+            data = dumps(data)
+        # only these are line breaks in event streams, unlike the ones
+        # :meth:`str.splitlines` knows about.
+        for line in _sse_line_re.split(data):
+            lines.append(u'data: ' + line)
+        return u'\n'.join(lines) + u'\n\n'
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.event)
+
+
+def stream_events(iterable, heartbeat=None, buffer_size=128):
+    """Returns a response that streams every item of `iterable` as a
+    server-sent event (``text/event-stream``).  Items can be
+    :class:`ServerSentEvent` objects or data for an unnamed event::
+
+        @app.route('/updates')
+        def updates():
+            def generate():
+                for change in watch_changes():
+                    yield ServerSentEvent(change, event='change')
+            return stream_events(generate())
+
+    By default the iterable is consumed like with :func:`stream_ndjson`.
+    Items that are `None` send a heartbeat comment, which keeps proxies
+    from closing the connection and lets the server notice a closed one.
+    Producers that wait for updates should therefore wait with a timeout
+    and yield `None` when it passes, so that a disconnected client stops
+    them within that time.
+
+    If `heartbeat` is set the iterable runs in a background thread
+    instead and a comment is sent whenever no event was sent for that many
+    seconds.  Events that are ready at the same time are then sent
+    together, at most `buffer_size` of them are held in memory.  A
+    producer that blocks keeps its thread until its next item even after
+    the client went away, which is why at most 64 of these threads run at
+    a time.  Further streams are sent without heartbeats.
+
+    :param iterable: the events to send, usually a generator.
+    :param heartbeat: the idle time in seconds after which a heartbeat
+                      comment is sent from a background thread, or `None`
+                      to consume the iterable in the server's thread.
+    :param buffer_size: how many encoded events may be buffered.
+    """
+    dumps = current_app.json_provider.dumps
+    def encode(item):
+        if item is None:
+            return _sse_heartbeat
+        if not isinstance(item, ServerSentEvent):
+            item = ServerSentEvent(item)
+        return item.encode(dumps)
+    return _streamed_response(_stream_records(
+        iterable, encode, buffer_size, _sse_heartbeat, heartbeat),
+        'text/event-stream')
+
+
 def make_response(*args):
     """
         def index():
@@ -205,11 +478,128 @@ def get_flashed_messages(with_categories=False, category_filter=[]):
     return flashes
 
 
+# requests with more ranges than this (after merging) get the whole file.
+_max_ranges = 32
+
+
+def _iter_file_ranges(file, parts, chunk_size=65536):
+    """Streams the ``(start, stop)`` byte ranges of `file`, with the bytes
+    in `parts` sent as they are.  Closes the file when done.
+    """
+    try:
+        for part in parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            start, stop = part
+            file.seek(start)
+            while start < stop:
+                data = file.read(min(chunk_size, stop - start))
+                if not data:
+                    # the file was truncated while it was sent
+                    return
+                yield data
+                start += len(data)
+    finally:
+        file.close()
+
+
+def _if_range_matches(rv):
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        etag, weak = rv.get_etag()
+        if_etag, if_weak = unquote_etag(value)
+        return not (weak or if_weak) and etag is not None and etag == if_etag
+    date = parse_date(value)
+    return date is not None and rv.last_modified is not None and \
+        date == rv.last_modified
+
+
+def _resolve_ranges(ranges, length):
+    rv = []
+    for start, stop in ranges:
+        if start < 0:
+            start = max(length + start, 0)
+            stop = length
+        elif stop is None or stop > length:
+            stop = length
+        if start < stop:
+            rv.append([start, stop])
+    rv.sort()
+    merged = rv[:1]
+    for start, stop in rv[1:]:
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return merged
+
+
+def _make_range_response(rv, file, length):
+    """Turns the response for a whole file into a 206 response for the
+    ranges in the ``Range`` header or a 416 response if none of them can
+    be satisfied.  Invalid headers are ignored.
+    """
+    if request.method not in ('GET', 'HEAD') or not _if_range_matches(rv):
+        return
+    header = parse_range_header(request.headers.get('Range'))
+    if header is None or header.units != 'bytes':
+        return
+    ranges = _resolve_ranges(header.ranges, length)
+    if len(ranges) > _max_ranges:
+        return
+
+    if not ranges:
+        file.close()
+        rv.response = []
+        rv.status_code = 416
+        rv.headers['Content-Range'] = 'bytes */%d' % length
+        rv.headers['Content-Length'] = '0'
+        return
+
+    rv.status_code = 206
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        rv.headers['Content-Range'] = 'bytes %d-%d/%d' % (start, stop - 1,
+                                                         length)
+        rv.headers['Content-Length'] = str(stop - start)
+        if stop == length and 'wsgi.file_wrapper' in request.environ:
+            # the server can send the rest of the file with sendfile
+            file.seek(start)
+            rv.response = wrap_file(request.environ, file)
+        else:
+            rv.response = _iter_file_ranges(file, [(start, stop)])
+        return
+
+    boundary = uuid.uuid4().hex
+    content_type = rv.headers.get('Content-Type', 'application/octet-stream')
+    parts = []
+    size = 0
+    for start, stop in ranges:
+        part_header = ('\r\n--%s\r\nContent-Type: %s\r\n'
+                       'Content-Range: bytes %d-%d/%d\r\n\r\n' % (
+                           boundary, content_type, start, stop - 1,
+                           length)).encode('latin1')
+        parts.append(part_header)
+        parts.append((start, stop))
+        size += len(part_header) + stop - start
+    end = ('\r\n--%s--\r\n' % boundary).encode('latin1')
+    parts.append(end)
+    size += len(end)
+    rv.headers['Content-Type'] = 'multipart/byteranges; boundary=' + boundary
+    rv.headers['Content-Length'] = str(size)
+    rv.response = _iter_file_ranges(file, parts)
+
+
 def send_file(filename_or_fp, mimetype=None, as_attachment=False, 
-              attachment_filename=None, add_dtags=True,
+              attachment_filename=None, add_etags=True,
               cache_timeout=None, conditional=False):
     mtime = None
-    if isinstance(filename_or_fp, (str, unicode)):
+    info = None
+    length = None
+    if isinstance(filename_or_fp, string_types):
         filename = filename_or_fp
         file = None
     else:
@@ -220,10 +610,16 @@ def send_file(filename_or_fp, mimetype=None, as_attachment=False,
     if filename is not None:
         if not os.path.isabs(filename):
             filename = os.path.join(current_app.root_path, filename)
-    if mimetype is None and (filename or attachment_filename):
-        memetype = mimetypes.guess_type(filename or attachment_filename)[0]
+        if file is None:
+            # only good for the mimetype and X-Sendfile, the size and
+            # mtime of the response come from the file that is opened.
+            info = get_static_file_info(filename)
+    if mimetype is None and info is not None:
+        mimetype = info.mimetype
+    elif mimetype is None and (filename or attachment_filename):
+        mimetype = mimetypes.guess_type(filename or attachment_filename)[0]
     if mimetype is None:
-        memetype = 'application/octet-stream'
+        mimetype = 'application/octet-stream'
 
     headers = Headers()
     if as_attachment:
@@ -238,17 +634,36 @@ def send_file(filename_or_fp, mimetype=None, as_attachment=False,
         if file is not None:
             file.close()
         headers['X-Sendfile'] = filename
-        headers['Content-Length'] = os.path.getsize(filename)
+        if info is not None:
+            headers['Content-Length'] = info.size
+        else:
+            headers['Content-Length'] = os.path.getsize(filename)
         data = None
     else:
         if file is None:
-            file = open(filename, 'rb')
-            mtime = os.path.getmtime(filename)
-            headers['Content-Length'] = os.path.getsize(filename)
+            try:
+                file = open(filename, 'rb')
+            except (IOError, OSError):
+                if info is None:
+                    raise
+                # removed after its info was cached
+                _update_static_file_info(filename, None)
+                raise NotFound()
+            st = os.fstat(file.fileno())
+            if info is None or (info.size, info.mtime) != \
+               (st.st_size, st.st_mtime):
+                # the cached info is outdated, the response has to match
+                # the file that is sent.
+                info = _static_file_info(filename, st)
+                _update_static_file_info(filename, info)
+            if info is not None:
+                mtime = info.mtime
+                length = info.size
+                headers['Content-Length'] = length
         data = wrap_file(request.environ, file)
 
     rv = current_app.response_class(data, mimetype=mimetype, headers=headers,
-                                    direct_passthrouth=True)
+                                    direct_passthrough=True)
 
     if mtime is not None:
         rv.last_modified = int(mtime)
@@ -261,18 +676,19 @@ def send_file(filename_or_fp, mimetype=None, as_attachment=False,
         rv.expires = int(time() + cache_timeout)
 
     if add_etags and filename is not None:
-        rv.set_etag('flask-%s-%s-%s' % (
-            os.path.getmtime(filename),
-            os.path.getsize(filename),
-            adler32(
-                filename.encode('utf-8') if isinstance(filename, unicode)
-                else filename
-            ) & 0xffffffff
-        ))
+        if info is None:
+            info = _stat_static_file(filename)
+        if info is not None:
+            rv.set_etag(info.etag)
         if conditional:
             rv = rv.make_conditional(request)
             if rv.status_code == 304:
                 rv.headers.pop('x-sendfile', None)
+
+    if conditional and length is not None:
+        rv.headers['Accept-Ranges'] = 'bytes'
+        if rv.status_code == 200 and 'Range' in request.headers:
+            _make_range_response(rv, file, length)
     return rv
 
 
@@ -288,12 +704,50 @@ def safe_join(directory, filename):
     return os.path.join(directory, filename)
 
 
+#: the content encodings of precompressed files in order of preference
+#: with the extension of the files.
+_precompressed_encodings = [('br', '.br'), ('gzip', '.gz')]
+
+
+def _find_precompressed(filename, info):
+    """Returns the sidecar files with compressed versions of `filename`
+    that are not older than the file as ``(encoding, filename)`` pairs.
+    """
+    rv = []
+    for encoding, ext in _precompressed_encodings:
+        sidecar = get_static_file_info(filename + ext)
+        if sidecar is not None and sidecar.mtime >= info.mtime:
+            rv.append((encoding, filename + ext))
+    return rv
+
+
 def send_from_directory(directory, filename, **options):
     filename = safe_join(directory, filename)
-    if not os.path.isfile(filename):
+    info = get_static_file_info(filename)
+    if info is None:
         raise NotFound()
     options.setdefault('conditional', True)
-    return send_file(filename, **options)
+    if not current_app.config['SEND_FILE_PRECOMPRESSED']:
+        return send_file(filename, **options)
+
+    sidecars = _find_precompressed(filename, info)
+    if not sidecars:
+        return send_file(filename, **options)
+    accept = request.accept_encodings
+    for encoding, sidecar in sidecars:
+        if accept[encoding]:
+            if options.get('mimetype') is None:
+                options['mimetype'] = info.mimetype
+            if options.get('as_attachment'):
+                options.setdefault('attachment_filename',
+                                   os.path.basename(filename))
+            rv = send_file(sidecar, **options)
+            rv.headers['Content-Encoding'] = encoding
+            break
+    else:
+        rv = send_file(filename, **options)
+    rv.vary.add('Accept-Encoding')
+    return rv
 
 
 def get_root_path(import_name):
@@ -371,6 +825,226 @@ class locked_cached_property(object):
             return value
 
 
+class LRUCache(object):
+    """A thread safe mapping of limited size that evicts the least
+    recently used items first.  Items can optionally expire after a
+    number of seconds.  The number of lookups that found an item and
+    the ones that did not are counted in :attr:`hits` and :attr:`misses`.
+
+    :param maxsize: the maximum number of items kept.
+    :param timeout: the default number of seconds after which an item
+                    expires or `None` if items do not expire.
+    """
+
+    def __init__(self, maxsize=128, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= time():
+                self.misses += 1
+                return default
+            self._data[key] = (value, expires)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        expires = None
+        if timeout is not None:
+            expires = time() + timeout
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, _missing) is not _missing
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def sweep(self):
+        """Removes all expired items and returns how many were removed."""
+        now = time()
+        with self._lock:
+            expired = [key for key, (value, expires) in self._data.items()
+                       if expires is not None and expires <= now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+    def __contains__(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and (item[1] is None or item[1] > time())
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return '<%s %d/%d items, %d hits, %d misses>' % (
+            self.__class__.__name__,
+            len(self._data),
+            self.maxsize,
+            self.hits,
+            self.misses,
+        )
+
+
+#: the metadata of a file sent by :func:`send_file`.
+StaticFileInfo = namedtuple('StaticFileInfo', ['size', 'mtime', 'mimetype',
+                                               'etag'])
+
+
+def _static_file_info(filename, st):
+    if not S_ISREG(st.st_mode):
+        return None
+    etag = 'flask-%s-%s-%s' % (
+        st.st_mtime,
+        st.st_size,
+        adler32(
+            filename.encode('utf-8') if isinstance(filename, text_type)
+            else filename
+        ) & 0xffffffff
+    )
+    return StaticFileInfo(st.st_size, st.st_mtime,
+                          mimetypes.guess_type(filename)[0], etag)
+
+
+def _stat_static_file(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return _static_file_info(filename, st)
+
+
+def get_static_file_info(filename):
+    """Returns the :class:`StaticFileInfo` of a file or `None` if it is
+    not a regular file.  Uses the application's
+    :attr:`~flask.Flask.static_file_cache` if there is one.
+    """
+    cache = current_app.static_file_cache
+    if cache is None:
+        return _stat_static_file(filename)
+    return cache.get(filename)
+
+
+def _update_static_file_info(filename, info):
+    cache = current_app.static_file_cache
+    if cache is not None:
+        cache.set(filename, info)
+
+
+class StaticFileCache(object):
+    """Caches the size, modification time, mimetype and etag of files sent
+    with :func:`send_file` by path so that sending a file needs at most one
+    `stat` call.  Entries expire after `timeout` seconds.  After
+    :meth:`watch` was called, entries of paths in the watched folders
+    expire as soon as inotify reports a change instead.
+
+    Paths that are not files are only cached in watched folders or if
+    `cache_misses` is enabled, so that repeated 404s do not touch the
+    filesystem either.  Without a watch, a file created at such a path
+    is then not found until the entry expired.
+
+    :param maxsize: the maximum number of paths kept.
+    :param timeout: the number of seconds after which an entry expires.
+    :param cache_misses: also cache paths that are not files outside of
+                         watched folders.
+    """
+
+    def __init__(self, maxsize=1024, timeout=2, cache_misses=False):
+        self._cache = LRUCache(maxsize, timeout)
+        self.cache_misses = cache_misses
+        self._watched = ()
+        self._stop = None
+
+    def get(self, filename):
+        rv = self._cache.get(filename, _missing)
+        if rv is _missing:
+            rv = _stat_static_file(filename)
+            self.set(filename, rv)
+        return rv
+
+    def set(self, filename, info):
+        """Stores the :class:`StaticFileInfo` of a path, `None` for a path
+        that is not a file.
+        """
+        if filename.startswith(self._watched):
+            # removed by :meth:`_files_changed` when the file changes
+            self._cache.set(filename, info, float('inf'))
+        elif info is not None or self.cache_misses:
+            self._cache.set(filename, info)
+        else:
+            self._cache.delete(filename)
+
+    def invalidate(self, filename=None):
+        """Removes a path or, without a path, all paths from the cache."""
+        if filename is None:
+            self._cache.clear()
+        else:
+            self._cache.delete(filename)
+
+    def _files_changed(self, paths, structural):
+        if paths is None:
+            return self._cache.clear()
+        for path in paths:
+            if path.endswith(os.path.sep):
+                return self._cache.clear()
+            self._cache.delete(path)
+
+    def watch(self, folders):
+        """Starts removing entries of the `folders` when inotify reports
+        a change, in which case these entries no longer expire.  Paths
+        outside of the folders keep expiring after the timeout.  Returns
+        `False` if inotify is not available and the timeout is used for
+        all paths.
+        """
+        from .watcher import InotifyBackend
+        try:
+            backend = InotifyBackend(folders, self._files_changed)
+        except OSError:
+            return False
+        self._watched = tuple(os.path.abspath(x).rstrip(os.path.sep) +
+                              os.path.sep for x in folders)
+        self._cache.clear()
+        self._stop = Event()
+        thread = Thread(target=backend.run, args=(self._stop,))
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def stop(self):
+        """Stops watching the folders."""
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+            self._watched = ()
+            self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self._cache)
+
+
 class _PackageBoundObject(object):
     
     def __init__(self, import_name, template_folder=None):
@@ -415,6 +1089,20 @@ class _PackageBoundObject(object):
     def send_static_file(self, filename):
         if not self.has_static_folder:
             raise RuntimeError('No static folder for this object')
+        manifest = current_app.static_manifest
+        if manifest is not None:
+            original = manifest.resolve(request.endpoint, filename)
+            if original is not None:
+                filename = original
+                info = get_static_file_info(
+                    safe_join(self.static_folder, filename))
+                if info is not None and manifest.is_current(info.mtime):
+                    # the name changes with the content, so it can be
+                    # cached for as long as browsers allow.
+                    rv = send_from_directory(self.static_folder, filename,
+                                             cache_timeout=manifest.max_age)
+                    rv.cache_control['immutable'] = None
+                    return rv
         cache_timeout = self.get_send_file_max_age(filename)
         return send_from_directory(self.static_folder, filename,
                                    cache_timeout=cache_timeout)
@@ -8,6 +8,7 @@
 import io
 import uuid
 from datetime import datetime
+from types import GeneratorType
 
 from werkzeug.http import http_date
 from jinja2 import Markup
@@ -16,7 +17,9 @@ try:
 except ImportError:
     from itsdangerous import json as _json
 
-from .globals import current_app, request
+from .globals import _app_ctx_stack, current_app, request
+from .helpers import stream_with_context
+from ._compat import text_type, string_types, integer_types
 
 
 _slash_escape = '\\/' not in _json.dumps('/')
@@ -24,7 +27,7 @@ _slash_escape = '\\/' not in _json.dumps('/')
 
 __all__ = ['dump', 'dumps', 'load', 'loads', 'htmlsafe_dump',
            'htmlsafe_dumps', 'JSONDecoder', 'JSONEncoder',
-           'jsonify']
+           'JSONProvider', 'jsonify', 'stream_jsonify']
 
 
 def _wrap_reader_for_text(fp, encoding):
@@ -57,51 +60,175 @@ class JSONDecoder(_json.JSONDecoder):
     """The default JSON decoder."""
 
 
-def _dump_arg_defaults(kwargs):
-    if current_app:
-        kwargs.setdefault('cls', current_app.json_encoder)
-        if not current_app.config['JSON_AS_ASCII']:
-            kwargs.setdefault('ensure_ascii', False)
-        kwargs.setdefault('sort_keys', current_app.config['JSON_SORT_KEYS'])
-    else:
-        kwargs.setdefault('sort_keys', True)
-        kwargs.setdefault('cls', JSONEncoder)
-
-
-def _load_arg_defaults(kwargs):
-    if current_app:
-        kwargs.setdefault('cls', current_app.json_encoder)
-    else:
-        kwargs.setdefault('cls', JSONDecoder)
+def _import_backend(name):
+    try:
+        return __import__(name)
+    except ImportError:
+        from warnings import warn
+        warn('The JSON backend %r was configured but could not be '
+             'imported, the default module is used instead.' % name,
+             RuntimeWarning, stacklevel=3)
+
+
+class JSONProvider(object):
+    """Encodes and decodes JSON for an application.  Every application
+    creates one from :attr:`~flask.Flask.json_provider_class` on first use
+    and resolves the options that depend on the configuration
+    (``JSON_AS_ASCII``, ``JSON_SORT_KEYS``, ``JSONIFY_PRETTYPRINT_REGULAR``
+    and ``JSON_BACKEND``) only once.  Changes to these keys after the
+    provider was created do not have an effect.
+
+    ``JSON_BACKEND`` selects the module that does the work for the plain
+    :func:`dumps` and :func:`loads` calls.  It can be `None` (the module
+    itsdangerous uses), ``'json'``, ``'simplejson'`` or ``'orjson'``.  A
+    backend that is not installed is replaced by the default module with
+    a warning.  Whenever a backend cannot encode a value, the value is
+    encoded with :attr:`~flask.Flask.json_encoder` instead.  orjson always
+    writes compact output without spaces after separators and may format
+    floats differently than the default module.  Calls with additional
+    arguments always use the default module.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            encoder = app.json_encoder
+            decoder = app.json_decoder
+            sort_keys = app.config['JSON_SORT_KEYS']
+            self.ensure_ascii = app.config['JSON_AS_ASCII']
+            backend = app.config['JSON_BACKEND']
+            self.jsonify_indent = None
+            if app.config['JSONIFY_PRETTYPRINT_REGULAR']:
+                self.jsonify_indent = 2
+        else:
+            encoder = JSONEncoder
+            decoder = JSONDecoder
+            sort_keys = True
+            self.ensure_ascii = True
+            backend = None
+            self.jsonify_indent = 2
+
+        self.dump_options = {'cls': encoder, 'sort_keys': sort_keys}
+        if not self.ensure_ascii:
+            self.dump_options['ensure_ascii'] = False
+        self.load_options = {'cls': decoder}
+
+        # the encoder and decoder instances are reused for all calls
+        # instead of creating new ones every time.
+        options = dict(sort_keys=sort_keys, ensure_ascii=self.ensure_ascii)
+        self._default = encoder(**options).default
+        self._encoders = {
+            None: encoder(**options),
+            2: encoder(indent=2, **options),
+        }
+        self._decoder = decoder()
+        self._dumps = self._dumps_encoder
+        self._loads = self._loads_decoder
+
+        module = None
+        if backend is not None:
+            module = _import_backend(backend)
+        if module is not None and backend == 'orjson':
+            self._init_orjson(module, sort_keys, decoder)
+        elif module is not None:
+            if not issubclass(encoder, module.JSONEncoder):
+                self._encoders = dict((indent, module.JSONEncoder(
+                    indent=indent, default=self._default, **options))
+                    for indent in self._encoders)
+            if not issubclass(decoder, module.JSONDecoder):
+                self._decoder = module.JSONDecoder()
+
+    def _init_orjson(self, orjson, sort_keys, decoder):
+        self._orjson = orjson
+        # datetimes are passed to the encoder's default so that they are
+        # formatted the same as with the other backends.
+        self._orjson_options = orjson.OPT_PASSTHROUGH_DATETIME | \
+            orjson.OPT_PASSTHROUGH_DATACLASS
+        if sort_keys:
+            self._orjson_options |= orjson.OPT_SORT_KEYS
+        self._dumps = self._dumps_orjson
+        if decoder is JSONDecoder:
+            self._loads = orjson.loads
+
+    def _dumps_encoder(self, obj, indent):
+        return self._encoders[indent].encode(obj)
+
+    def _dumps_orjson(self, obj, indent):
+        option = self._orjson_options
+        if indent is not None:
+            option |= self._orjson.OPT_INDENT_2
+        try:
+            rv = self._orjson.dumps(obj, default=self._default, option=option)
+        except TypeError:
+            return self._encoders[indent].encode(obj)
+        if self.ensure_ascii and not rv.isascii():
+            return self._encoders[indent].encode(obj)
+        return rv.decode('utf-8')
+
+    def _loads_decoder(self, s):
+        if isinstance(s, bytes):
+            s = s.decode('utf-8')
+        return self._decoder.decode(s)
+
+    def dumps(self, obj, **kwargs):
+        encoding = kwargs.pop('encoding', None)
+        if not kwargs:
+            rv = self._dumps(obj, None)
+        elif len(kwargs) == 1 and kwargs.get('indent', 0) in self._encoders:
+            rv = self._dumps(obj, kwargs['indent'])
+        else:
+            rv = _json.dumps(obj, **dict(self.dump_options, **kwargs))
+        if encoding is not None and isinstance(rv, text_type):
+            rv = rv.encode(encoding)
+        return rv
+
+    def dump(self, obj, fp, **kwargs):
+        encoding = kwargs.pop('encoding', None)
+        if encoding is not None:
+            fp = _wrap_writer_for_text(fp, encoding)
+        _json.dump(obj, fp, **dict(self.dump_options, **kwargs))
+
+    def loads(self, s, **kwargs):
+        if not kwargs:
+            return self._loads(s)
+        if isinstance(s, bytes):
+            s = s.decode(kwargs.pop('encoding', None) or 'utf-8')
+        return _json.loads(s, **dict(self.load_options, **kwargs))
+
+    def load(self, fp, **kwargs):
+        return _json.load(fp, **dict(self.load_options, **kwargs))
+
+    def raw_decode(self, s, idx=0):
+        """Decodes the JSON document that starts at `idx` in the string `s`
+        and returns it together with the index where it ended.
+        """
+        return self._decoder.raw_decode(s, idx)
+
+
+_default_provider = JSONProvider()
+
+
+def _get_provider():
+    top = _app_ctx_stack.top
+    if top is not None:
+        return top.app.json_provider
+    return _default_provider
 
 
 def dumps(obj, **kwargs):
-    _dump_arg_defaults(kwargs)
-    encoding = kwargs.pop('encoding', None)
-    rv = _json.dumps(obj, **kwargs)
-    if encoding is not None and isinstance(rv, unicode):
-        rv = rv.encode(encoding)
-    return rv
+    return _get_provider().dumps(obj, **kwargs)
 
 
 def dump(obj, fp, **kwargs):
-    _dump_arg_defaults(kwargs)
-    encoding = kwargs.pop('encoding', None)
-    if encoding is not None:
-        fp = _wrap_writer_for_text(fp, encoding)
-    _json.dump(obj, fp, **kwargs)
+    _get_provider().dump(obj, fp, **kwargs)
 
 
 def loads(s, **kwargs):
-    _load_arg_defaults(kwargs)
-    if isinstance(s, bytes):
-        s = s.decode(kwargs.pop('encoding', None) or 'utf-8')
-    return _json.loads(s, **kwargs)
+    return _get_provider().loads(s, **kwargs)
 
 
 def load(fp, **kwargs):
-    _load_arg_defaults(kwargs)
-    return _json.load(fp, **kwargs)
+    return _get_provider().load(fp, **kwargs)
 
 
 def htmlsafe_dumps(obj, **kwargs):
@@ -120,15 +247,115 @@ def htmlsafe_dump(obj, fp, **kwargs):
 
 
 def jsonify(*args, **kwargs):
-    indent = None
-    if current_app.config['JSONIFY_PRETTYPRINT_REGULAR'] \
-       and not request.is_xhr:
-        indent = 2
-    return current_app.response_class(dumps(dict(*args, **kwargs),
+    provider = current_app.json_provider
+    indent = provider.jsonify_indent
+    if indent is not None and request.is_xhr:
+        indent = None
+    return current_app.response_class(provider.dumps(dict(*args, **kwargs),
         indent=indent),
         mimetype='application/json')
 
 
+def _is_stream(obj):
+    return isinstance(obj, GeneratorType) or \
+        hasattr(obj, '__next__') or hasattr(obj, 'next')
+
+
+def _encode_key(provider, key):
+    # keys are converted like the json module does it
+    if isinstance(key, text_type):
+        pass
+    elif key is None or isinstance(key, (bool, float) + integer_types):
+        key = provider.dumps(key)
+    else:
+        raise TypeError('keys must be str, int, float, bool or None, '
+                        'not %s' % type(key).__name__)
+    return provider.dumps(key)
+
+
+def _iter_encode_stream(provider, obj, indent, sort_keys, depth=1):
+    if isinstance(obj, dict):
+        start, end = u'{', u'}'
+        keys = sorted(obj) if sort_keys else obj
+        items = ((key, obj[key]) for key in keys)
+    else:
+        start, end = u'[', u']'
+        items = ((None, value) for value in obj)
+
+    if indent is None:
+        newline = u''
+        separator = u', '
+    else:
+        newline = u'\n' + u' ' * (indent * depth)
+        separator = u','
+
+    yield start
+    first = True
+    for key, value in items:
+        yield newline if first else separator + newline
+        first = False
+        if end == u'}':
+            yield _encode_key(provider, key) + u': '
+        if _is_stream(value):
+            for chunk in _iter_encode_stream(provider, value, indent,
+                                             sort_keys, depth + 1):
+                yield chunk
+            continue
+        rv = provider.dumps(value, indent=indent)
+        if indent is not None:
+            rv = rv.replace(u'\n', newline)
+        yield rv
+    if not first and indent is not None:
+        yield u'\n' + u' ' * (indent * (depth - 1))
+    yield end
+
+
+def stream_jsonify(*args, **kwargs):
+    """Like :func:`jsonify` but encodes the document incrementally and
+    returns a streamed response.  Either pass a single iterable (which
+    becomes a top-level array), a dict or keyword arguments (which become
+    a top-level object)::
+
+        @app.route('/export')
+        def export():
+            return stream_jsonify(row_to_dict(row) for row in query())
+
+    Top-level items are encoded one at a time; values that are iterators
+    or generators are streamed as arrays as well.  The output is buffered
+    into chunks of ``JSONIFY_STREAM_CHUNK_SIZE`` characters and the
+    request context is kept around while the response is sent.
+    """
+    if len(args) > 1 or (args and kwargs):
+        raise TypeError('stream_jsonify() takes either a single iterable '
+                        'or keyword arguments')
+    obj = args[0] if args else kwargs
+    if isinstance(obj, (string_types, bytes)):
+        raise TypeError('stream_jsonify() takes an iterable of items, not '
+                        'a string')
+    provider = current_app.json_provider
+    indent = provider.jsonify_indent
+    if indent is not None and request.is_xhr:
+        indent = None
+    sort_keys = provider.dump_options['sort_keys']
+    chunk_size = current_app.config['JSONIFY_STREAM_CHUNK_SIZE']
+
+    def generate():
+        buf = []
+        size = 0
+        for chunk in _iter_encode_stream(provider, obj, indent, sort_keys):
+            buf.append(chunk)
+            size += len(chunk)
+            if size >= chunk_size:
+                yield u''.join(buf)
+                del buf[:]
+                size = 0
+        if buf:
+            yield u''.join(buf)
+
+    return current_app.response_class(stream_with_context(generate()),
+                                      mimetype='application/json')
+
+
 def tojson_filter(obj, **kwargs):
     return Markup(htmlsafe_dumps(obj, **kwargs))
 
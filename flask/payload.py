@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.payload
+    ~~~~~~~~~~~~~
+
+    Codecs for the payloads of requests and of responses created from
+    dicts and lists.  The codec is picked by the mimetype of the request
+    or the ``Accept`` header of the client.
+"""
+
+import uuid
+import struct
+from datetime import datetime
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+from . import json
+from ._compat import text_type, integer_types, iteritems
+
+
+def _default(obj):
+    # values without a native representation are converted the same way
+    # the JSON encoder of the application converts them.
+    return json._get_provider()._default(obj)
+
+
+class PayloadCodec(object):
+    """Base class for payload codecs.  The first of the :attr:`mimetypes`
+    is the one responses are sent with.
+    """
+
+    #: the mimetypes this codec handles.
+    mimetypes = ()
+
+    @property
+    def mimetype(self):
+        return self.mimetypes[0]
+
+    def dumps(self, obj):
+        """Encodes `obj` to bytes."""
+        raise NotImplementedError()
+
+    def loads(self, data):
+        """Decodes bytes.  Raises a :exc:`ValueError` for invalid data."""
+        raise NotImplementedError()
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.mimetype)
+
+
+class JSONCodec(PayloadCodec):
+    """Encodes payloads with :mod:`flask.json`."""
+    mimetypes = ('application/json',)
+
+    def dumps(self, obj):
+        return json.dumps(obj).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+def _pack(obj, out, default):
+    pack = struct.pack
+    if obj is None:
+        out.append(b'\xc0')
+    elif obj is True:
+        out.append(b'\xc3')
+    elif obj is False:
+        out.append(b'\xc2')
+    elif isinstance(obj, integer_types):
+        if 0 <= obj < 0x80:
+            out.append(pack('B', obj))
+        elif -0x20 <= obj < 0:
+            out.append(pack('b', obj))
+        elif obj > 0:
+            if obj <= 0xff:
+                out.append(pack('>BB', 0xcc, obj))
+            elif obj <= 0xffff:
+                out.append(pack('>BH', 0xcd, obj))
+            elif obj <= 0xffffffff:
+                out.append(pack('>BI', 0xce, obj))
+            elif obj <= 0xffffffffffffffff:
+                out.append(pack('>BQ', 0xcf, obj))
+            else:
+                raise OverflowError('Integer too large for MessagePack')
+        elif obj >= -0x80:
+            out.append(pack('>Bb', 0xd0, obj))
+        elif obj >= -0x8000:
+            out.append(pack('>Bh', 0xd1, obj))
+        elif obj >= -0x80000000:
+            out.append(pack('>Bi', 0xd2, obj))
+        elif obj >= -0x8000000000000000:
+            out.append(pack('>Bq', 0xd3, obj))
+        else:
+            raise OverflowError('Integer too small for MessagePack')
+    elif isinstance(obj, float):
+        out.append(pack('>Bd', 0xcb, obj))
+    elif isinstance(obj, text_type):
+        data = obj.encode('utf-8')
+        n = len(data)
+        if n < 32:
+            out.append(pack('B', 0xa0 | n))
+        elif n <= 0xff:
+            out.append(pack('>BB', 0xd9, n))
+        elif n <= 0xffff:
+            out.append(pack('>BH', 0xda, n))
+        else:
+            out.append(pack('>BI', 0xdb, n))
+        out.append(data)
+    elif isinstance(obj, (bytes, bytearray)):
+        n = len(obj)
+        if n <= 0xff:
+            out.append(pack('>BB', 0xc4, n))
+        elif n <= 0xffff:
+            out.append(pack('>BH', 0xc5, n))
+        else:
+            out.append(pack('>BI', 0xc6, n))
+        out.append(bytes(obj))
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        if n < 16:
+            out.append(pack('B', 0x90 | n))
+        elif n <= 0xffff:
+            out.append(pack('>BH', 0xdc, n))
+        else:
+            out.append(pack('>BI', 0xdd, n))
+        for item in obj:
+            _pack(item, out, default)
+    elif isinstance(obj, dict):
+        n = len(obj)
+        if n < 16:
+            out.append(pack('B', 0x80 | n))
+        elif n <= 0xffff:
+            out.append(pack('>BH', 0xde, n))
+        else:
+            out.append(pack('>BI', 0xdf, n))
+        for key, value in obj.items():
+            _pack(key, out, default)
+            _pack(value, out, default)
+    else:
+        _pack(default(obj), out, default)
+
+
+def packb(obj, default=_default):
+    """Encodes `obj` as MessagePack.  This is a pure Python implementation
+    that is used if the msgpack library is not installed.
+    """
+    out = []
+    _pack(obj, out, default)
+    return b''.join(out)
+
+
+# fixed size formats: first byte -> (struct format, size)
+_fixed_formats = {
+    0xca: ('>f', 4), 0xcb: ('>d', 8),
+    0xcc: ('>B', 1), 0xcd: ('>H', 2), 0xce: ('>I', 4), 0xcf: ('>Q', 8),
+    0xd0: ('>b', 1), 0xd1: ('>h', 2), 0xd2: ('>i', 4), 0xd3: ('>q', 8),
+}
+
+# first byte -> (length format, size, kind)
+_sized_formats = {
+    0xc4: ('>B', 1, 'bin'), 0xc5: ('>H', 2, 'bin'), 0xc6: ('>I', 4, 'bin'),
+    0xd9: ('>B', 1, 'str'), 0xda: ('>H', 2, 'str'), 0xdb: ('>I', 4, 'str'),
+    0xdc: ('>H', 2, 'array'), 0xdd: ('>I', 4, 'array'),
+    0xde: ('>H', 2, 'map'), 0xdf: ('>I', 4, 'map'),
+}
+
+_constants = {0xc0: None, 0xc2: False, 0xc3: True}
+
+# arrays and maps nested deeper than this are rejected instead of running
+# into the recursion limit.
+_max_depth = 512
+
+
+def _unpack(data, pos, depth=0):
+    b = data[pos]
+    pos += 1
+    if b < 0x80:
+        return b, pos
+    if b >= 0xe0:
+        return b - 0x100, pos
+    if b in _constants:
+        return _constants[b], pos
+    if b in _fixed_formats:
+        fmt, size = _fixed_formats[b]
+        return struct.unpack_from(fmt, data, pos)[0], pos + size
+    if b in _sized_formats:
+        fmt, size, kind = _sized_formats[b]
+        n = struct.unpack_from(fmt, data, pos)[0]
+        pos += size
+    elif b & 0xe0 == 0xa0:
+        n, kind = b & 0x1f, 'str'
+    elif b & 0xf0 == 0x90:
+        n, kind = b & 0x0f, 'array'
+    elif b & 0xf0 == 0x80:
+        n, kind = b & 0x0f, 'map'
+    else:
+        raise ValueError('Unsupported MessagePack type 0x%02x' % b)
+
+    if kind in ('str', 'bin'):
+        end = pos + n
+        if end > len(data):
+            raise ValueError('Truncated MessagePack data')
+        if kind == 'str':
+            return data[pos:end].decode('utf-8'), end
+        return bytes(data[pos:end]), end
+    depth += 1
+    if depth > _max_depth:
+        raise ValueError('MessagePack data is nested too deeply')
+    if kind == 'array':
+        rv = []
+        for _ in range(n):
+            item, pos = _unpack(data, pos, depth)
+            rv.append(item)
+        return rv, pos
+    rv = {}
+    for _ in range(n):
+        key, pos = _unpack(data, pos, depth)
+        if isinstance(key, (list, dict)):
+            raise ValueError('Unhashable MessagePack map key')
+        rv[key], pos = _unpack(data, pos, depth)
+    return rv, pos
+
+
+def unpackb(data):
+    """Decodes MessagePack.  The pure Python counterpart of
+    :func:`packb`.
+    """
+    data = bytearray(data)
+    try:
+        rv, pos = _unpack(data, 0)
+    except (IndexError, struct.error):
+        raise ValueError('Truncated MessagePack data')
+    if pos != len(data):
+        raise ValueError('Extra data after MessagePack object')
+    return rv
+
+
+class MessagePackCodec(PayloadCodec):
+    """Encodes payloads as MessagePack, with the msgpack library if it is
+    installed and in pure Python otherwise.
+    """
+    mimetypes = ('application/msgpack', 'application/x-msgpack')
+
+    def dumps(self, obj):
+        if msgpack is not None:
+            return msgpack.packb(obj, default=_default, use_bin_type=True)
+        return packb(obj)
+
+    def loads(self, data):
+        if msgpack is not None:
+            return msgpack.unpackb(data, raw=False)
+        return unpackb(data)
+
+
+def _convert_native(obj):
+    # cbor2 has its own encoding for datetimes and UUIDs (and fails for
+    # naive datetimes), these are converted like for the other codecs.
+    if isinstance(obj, dict):
+        return dict((k, _convert_native(v)) for k, v in iteritems(obj))
+    if isinstance(obj, (list, tuple)):
+        return [_convert_native(x) for x in obj]
+    if isinstance(obj, (datetime, uuid.UUID)):
+        return _default(obj)
+    return obj
+
+
+class CBORCodec(PayloadCodec):
+    """Encodes payloads as CBOR.  Requires the cbor2 library."""
+    mimetypes = ('application/cbor',)
+
+    def dumps(self, obj):
+        return cbor2.dumps(_convert_native(obj), default=lambda encoder,
+                           value: encoder.encode(_default(value)))
+
+    def loads(self, data):
+        return cbor2.loads(data)
+
+
+def get_default_codecs():
+    """Returns the codecs available in this environment.  JSON comes first
+    and is used for clients that do not state a preference.
+    """
+    rv = [JSONCodec(), MessagePackCodec()]
+    if cbor2 is not None:
+        rv.append(CBORCodec())
+    return rv
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.routing
+    ~~~~~~~~~~~~~
+
+    Implements helpers that speed up matching requests against the
+    application's url map.
+"""
+
+import re
+from operator import itemgetter
+
+from werkzeug.exceptions import NotFound, MethodNotAllowed
+
+from .helpers import LRUCache
+
+# renamed in newer versions of werkzeug
+try:
+    from werkzeug.routing import RequestSlash
+except ImportError:
+    from werkzeug.routing import RequestPath as RequestSlash
+
+
+_variable_re = re.compile(r'''
+    <
+    (?:
+        [a-zA-Z_][a-zA-Z0-9_]*      # converter name
+        (?:\((?:[^)]*)\))?          # converter arguments
+        \:                          # variable delimiter
+    )?
+    ([a-zA-Z_][a-zA-Z0-9_]*)        # variable name
+    >
+''', re.VERBOSE)
+_escaped_re = re.compile(r'\\.')
+
+
+_MATCHED = 0
+_NOT_FOUND = 1
+_METHOD_NOT_ALLOWED = 2
+
+
+class URLMatchCache(object):
+    """Remembers the outcome of matching a request against the url map.
+    The cache key is made of the host, script name, path and method of
+    the bound url adapter.  Successful matches, 404 and 405 results are
+    cached.  Redirects depend on the query string and are rare, so they
+    are always computed by matching again.
+
+    The cache is enabled with the ``URL_MATCH_CACHE_SIZE`` config key
+    and is cleared by the application whenever the url map changes.
+    """
+
+    def __init__(self, maxsize):
+        self._cache = LRUCache(maxsize)
+
+    @property
+    def hits(self):
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        return self._cache.misses
+
+    def clear(self):
+        self._cache.clear()
+
+    def match(self, url_adapter, match_func):
+        """Returns a ``(rule, view_args)`` tuple for the adapter's current
+        request like ``url_adapter.match(return_rule=True)`` does.  On a
+        cache miss `match_func` is called with the adapter to do the
+        actual matching.
+        """
+        key = (url_adapter.server_name, url_adapter.subdomain,
+               url_adapter.script_name, url_adapter.path_info,
+               url_adapter.default_method)
+        entry = self._cache.get(key)
+        if entry is None:
+            try:
+                rule, view_args = match_func(url_adapter)
+            except MethodNotAllowed as e:
+                entry = (_METHOD_NOT_ALLOWED, e.valid_methods, None)
+            except NotFound:
+                entry = (_NOT_FOUND, None, None)
+            else:
+                entry = (_MATCHED, rule, dict(view_args))
+            self._cache.set(key, entry)
+
+        kind, rule_or_methods, view_args = entry
+        if kind == _NOT_FOUND:
+            raise NotFound()
+        elif kind == _METHOD_NOT_ALLOWED:
+            raise MethodNotAllowed(valid_methods=rule_or_methods)
+        # view functions and url value preprocessors are free to modify
+        # the view arguments, so each request gets its own copy.
+        return rule_or_methods, dict(view_args)
+
+    def __repr__(self):
+        return '<%s %d items, %d hits, %d misses>' % (
+            self.__class__.__name__,
+            len(self._cache),
+            self.hits,
+            self.misses,
+        )
+
+
+class _TrieNode(object):
+    __slots__ = ('static', 'dynamic', 'rules', 'catchall')
+
+    def __init__(self):
+        #: children for segments without variables keyed by the segment
+        self.static = {}
+        #: the child for segments that contain variables
+        self.dynamic = None
+        #: rules that end at this node
+        self.rules = []
+        #: rules with a converter at this depth that can match slashes
+        #: (like ``path``) and therefore any remaining segments
+        self.catchall = []
+
+
+def _is_part_isolating(converter):
+    """Tells if the converter can only ever match within one path segment.
+    Converters that do not say so are checked conservatively: anything
+    that could match a slash is treated like the ``path`` converter.
+    """
+    rv = getattr(converter, 'part_isolating', None)
+    if rv is not None:
+        return rv
+    regex = _escaped_re.sub('', converter.regex.replace('[^/]', ''))
+    return '/' not in regex and '.' not in regex
+
+
+def _split_path(path):
+    path = path.strip('/')
+    if not path:
+        return []
+    return path.split('/')
+
+
+class TrieURLMatcher(object):
+    """Matches requests against a url map by walking a trie of path
+    segments instead of trying every rule in order.  Static segments are
+    looked up in dicts, segments with variables are shared by all rules
+    that have a variable at that position.  The rules collected from the
+    trie are then tried in url map order with their own regular
+    expressions, so the result is the same rule, view arguments, redirect
+    or 405 that ``url_adapter.match(return_rule=True)`` would give.
+
+    Rules that redirect (``redirect_to``, default redirects and strict
+    slash redirects) are rare and are handed to the url adapter to match
+    the regular way.
+
+    To use it set :attr:`~flask.Flask.url_matcher_class`::
+
+        app.url_matcher_class = TrieURLMatcher
+    """
+
+    def __init__(self, url_map):
+        self.url_map = url_map
+        self._root = _TrieNode()
+        self._redirecting = set()
+        url_map.update()
+        self._build()
+
+    def _build(self):
+        rules = list(self.url_map.iter_rules())
+        by_endpoint = {}
+        for rule in rules:
+            by_endpoint.setdefault(rule.endpoint, []).append(rule)
+        for index, rule in enumerate(rules):
+            if rule.redirect_to is not None or \
+               (self.url_map.redirect_defaults and
+                self._has_default_redirect(rule, by_endpoint)):
+                self._redirecting.add(index)
+            self._insert(index, rule)
+
+    def _has_default_redirect(self, rule, by_endpoint):
+        for other in by_endpoint[rule.endpoint]:
+            if other is not rule and other.defaults and \
+               other.provides_defaults_for(rule):
+                return True
+        return False
+
+    def _insert(self, index, rule):
+        node = self._root
+        for segment in _split_path(rule.rule):
+            variables = _variable_re.findall(segment)
+            if not variables:
+                child = node.static.get(segment)
+                if child is None:
+                    child = node.static[segment] = _TrieNode()
+                node = child
+                continue
+            for variable in variables:
+                if not _is_part_isolating(rule._converters[variable]):
+                    node.catchall.append((index, rule))
+                    return
+            if node.dynamic is None:
+                node.dynamic = _TrieNode()
+            node = node.dynamic
+        node.rules.append((index, rule))
+
+    def candidates(self, path_info):
+        """Returns ``(index, rule)`` tuples for the rules that could match
+        `path_info` sorted by their position in the url map.
+        """
+        rv = []
+        nodes = [self._root]
+        for segment in _split_path(path_info):
+            next_nodes = []
+            for node in nodes:
+                rv.extend(node.catchall)
+                child = node.static.get(segment)
+                if child is not None:
+                    next_nodes.append(child)
+                if node.dynamic is not None:
+                    next_nodes.append(node.dynamic)
+            nodes = next_nodes
+            if not nodes:
+                break
+        for node in nodes:
+            rv.extend(node.catchall)
+            rv.extend(node.rules)
+        rv.sort(key=itemgetter(0))
+        return rv
+
+    def match(self, url_adapter):
+        """Returns a ``(rule, view_args)`` tuple for the request the
+        adapter is bound to or raises the same routing exception that
+        ``url_adapter.match()`` would raise.
+        """
+        url_map = self.url_map
+        path_info = url_adapter.path_info
+        if '//' in path_info and getattr(url_map, 'merge_slashes', False):
+            return url_adapter.match(return_rule=True)
+        method = url_adapter.default_method.upper()
+        path = u'%s|%s' % (
+            url_map.host_matching and url_adapter.server_name or
+            url_adapter.subdomain,
+            path_info and '/%s' % path_info.lstrip('/')
+        )
+
+        have_match_for = set()
+        for index, rule in self.candidates(path_info):
+            try:
+                rv = rule.match(path)
+            except RequestSlash:
+                return url_adapter.match(return_rule=True)
+            if rv is None:
+                continue
+            if rule.methods is not None and method not in rule.methods:
+                have_match_for.update(rule.methods)
+                continue
+            if index in self._redirecting:
+                return url_adapter.match(return_rule=True)
+            return rule, rv
+
+        if have_match_for:
+            raise MethodNotAllowed(valid_methods=list(have_match_for))
+        raise NotFound()
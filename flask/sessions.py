@@ -3,19 +3,33 @@
     flask.sessions
     ~~~~~~~~~~~~~~
 
-    Implements cookie based sessions based on itsdangerous.
+    Implements cookie based sessions based on itsdangerous and server side
+    sessions that only keep a session id in the cookie.
 """
 
+import os
+import zlib
 import uuid
+import errno
 import hashlib
+import sqlite3
+import binascii
+import calendar
+from time import time, sleep
+from threading import Thread, local
 from base64 import b64encode, b64decode
 from datetime import datetime
+from weakref import WeakKeyDictionary
 
 from werkzeug.http import http_date, parse_date
 from werkzeug.datastructures import CallbackDict
-from itsdangerous import URLSafeTimedSerializer, BadSignature
+from itsdangerous import URLSafeTimedSerializer, TimestampSigner, \
+     BadSignature, BadPayload, SignatureExpired, base64_encode, \
+     base64_decode
 
 from . import Markup, json
+from ._compat import text_type, iteritems
+from .helpers import LRUCache
 
 
 def total_seconds(td):
@@ -92,9 +106,158 @@ class TaggedJSONSerializer(object):
 session_json_serializer = TaggedJSONSerializer()
 
 
+class CompactSessionSerializer(object):
+    """A faster and more compact replacement for the
+    :class:`TaggedJSONSerializer`.  Values are tagged by looking up their
+    type in a dispatch table instead of going through a chain of
+    :func:`isinstance` checks, and datetimes and UUIDs are stored in a
+    shorter form.  Payloads are prefixed with :attr:`version_prefix`;
+    payloads without it were written by the :class:`TaggedJSONSerializer`
+    and are still understood.
+
+    Additional types can be supported with :meth:`register`.
+    """
+
+    #: marks payloads written in this format.
+    version_prefix = u'1~'
+
+    def __init__(self):
+        self._dumpers = self._make_dumpers()
+        self._tags = []
+        self._loaders = {}
+        self.register(u't', tuple,
+                      lambda value: [self._tag(x) for x in value], tuple)
+        self.register(u'u', uuid.UUID, _dump_uuid, _load_uuid)
+        self.register(u'b', bytes,
+                      lambda value: b64encode(value).decode('ascii'),
+                      b64decode)
+        self.register(u'd', datetime, _dump_datetime,
+                      datetime.utcfromtimestamp)
+        self._loaders[u' m'] = Markup
+
+    def register(self, key, cls, to_json, from_json):
+        """Registers a tag for values of `cls` and its subclasses.
+        `to_json` converts a value to something the JSON encoder
+        understands and `from_json` converts it back.  Keys are short
+        strings and have to be unique.
+        """
+        key = u' ' + key
+        if key in self._loaders:
+            raise ValueError('Tag %r is already registered' % key.strip())
+        self._tags.append((cls, key, to_json))
+        self._loaders[key] = from_json
+        # types resolved before may be handled by the new tag now
+        self._dumpers = self._make_dumpers()
+
+    def _make_dumpers(self):
+        # type -> function that tags the value or `None` for values that
+        # are passed to the JSON encoder as they are.
+        rv = dict.fromkeys((text_type, int, float, bool, type(None)))
+        rv[list] = lambda value: [self._tag(x) for x in value]
+        rv[dict] = lambda value: dict(
+            (k, self._tag(v)) for k, v in iteritems(value))
+        return rv
+
+    def _resolve_dumper(self, cls):
+        if callable(getattr(cls, '__html__', None)):
+            rv = lambda value: {u' m': text_type(value.__html__())}
+        else:
+            rv = None
+            for tag_cls, key, to_json in self._tags:
+                if issubclass(cls, tag_cls):
+                    rv = _make_tagger(key, to_json)
+                    break
+            else:
+                for base in (list, dict):
+                    if issubclass(cls, base):
+                        rv = self._dumpers[base]
+                        break
+        self._dumpers[cls] = rv
+        return rv
+
+    def _tag(self, value):
+        try:
+            dumper = self._dumpers[type(value)]
+        except KeyError:
+            dumper = self._resolve_dumper(type(value))
+        if dumper is None:
+            return value
+        return dumper(value)
+
+    def _object_hook(self, obj):
+        if len(obj) == 1:
+            for key in obj:
+                loader = self._loaders.get(key)
+                if loader is not None:
+                    return loader(obj[key])
+        return obj
+
+    def _legacy_object_hook(self, obj):
+        if len(obj) == 1:
+            for key in obj:
+                loader = _legacy_loaders.get(key)
+                if loader is not None:
+                    return loader(obj[key])
+        return obj
+
+    def dumps(self, value):
+        return self.version_prefix + json.dumps(self._tag(value),
+                                                separators=(',', ':'))
+
+    def loads(self, value):
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        if value.startswith(self.version_prefix):
+            return json.loads(value[len(self.version_prefix):],
+                              object_hook=self._object_hook)
+        return json.loads(value, object_hook=self._legacy_object_hook)
+
+
+def _make_tagger(key, to_json):
+    return lambda value: {key: to_json(value)}
+
+
+def _dump_uuid(value):
+    return b64encode(value.bytes).decode('ascii').rstrip(u'=')
+
+
+def _load_uuid(value):
+    return uuid.UUID(bytes=b64decode(value + u'=='))
+
+
+def _dump_datetime(value):
+    return calendar.timegm(value.utctimetuple())
+
+
+# how payloads written by the TaggedJSONSerializer are read back
+_legacy_loaders = {
+    u' t': tuple,
+    u' u': uuid.UUID,
+    u' b': b64decode,
+    u' m': Markup,
+    u' d': parse_date,
+}
+
+
+compact_session_serializer = CompactSessionSerializer()
+
+
 class SecureCookieSession(CallbackDict, SessionMixin):
     """Baseclass for sessions based on signed cookies."""
 
+    #: the serialized payload the session was loaded with or `None` for
+    #: sessions that did not come from a cookie.  This is used to detect
+    #: changes that :attr:`modified` does not see, like changes of
+    #: mutable values in the session.
+    payload = None
+
+    #: the unix timestamp of when the loaded cookie was signed.
+    issued_at = None
+
+    #: the position of the key that verified the loaded cookie in the
+    #: secret keys, ``0`` if it was signed with the current key.
+    key_index = None
+
     def __init__(self, initial=None):
         def on_update(self):
             self.modified = True
@@ -193,6 +356,76 @@ class SessionInterface(object):
         raise NotImplementedError()
 
 
+class _KeyCachingSigner(TimestampSigner):
+    """A timestamp signer that derives the signing key only once."""
+
+    def __init__(self, *args, **kwargs):
+        TimestampSigner.__init__(self, *args, **kwargs)
+        self._derived_keys = {}
+
+    def derive_key(self, *args):
+        key = args and args[0] or None
+        rv = self._derived_keys.get(key)
+        if rv is None:
+            rv = self._derived_keys[key] = \
+                TimestampSigner.derive_key(self, *args)
+        return rv
+
+
+class SessionSigningSerializer(URLSafeTimedSerializer):
+    """The serializer used by :class:`SecureCookieSessionInterface`.  It
+    keeps its signers around instead of creating (and deriving the key of)
+    a new one for every cookie that is loaded or dumped.  Payloads are
+    only compressed if they are at least :attr:`compress_threshold` bytes
+    long, as small payloads hardly ever get shorter.
+    """
+    default_signer = _KeyCachingSigner
+
+    #: the size in bytes from which on payloads are compressed.
+    compress_threshold = 256
+
+    def __init__(self, *args, **kwargs):
+        URLSafeTimedSerializer.__init__(self, *args, **kwargs)
+        self._signers = {}
+
+    def make_signer(self, salt=None):
+        if salt is None:
+            salt = self.salt
+        rv = self._signers.get(salt)
+        if rv is None:
+            rv = self._signers[salt] = \
+                URLSafeTimedSerializer.make_signer(self, salt)
+        return rv
+
+    def loads_payload(self, s, max_age=None):
+        """Checks the signature and age of `s` like :meth:`loads` but
+        returns the serialized payload (decompressed, but not decoded)
+        together with the time it was signed.
+        """
+        payload, timestamp = self.make_signer(self.salt).unsign(
+            s, max_age=max_age, return_timestamp=True)
+        decompress = payload.startswith(b'.')
+        if decompress:
+            payload = payload[1:]
+        try:
+            payload = base64_decode(payload)
+            if decompress:
+                payload = zlib.decompress(payload)
+        except Exception as e:
+            raise BadPayload('Could not decode the payload', original_error=e)
+        return payload, timestamp
+
+    def dump_payload(self, obj):
+        json = self.serializer.dumps(obj)
+        if isinstance(json, text_type):
+            json = json.encode('utf-8')
+        if len(json) >= self.compress_threshold:
+            compressed = zlib.compress(json)
+            if len(compressed) < len(json) - 1:
+                return b'.' + base64_encode(compressed)
+        return base64_encode(json)
+
+
 class SecureCookieSessionInterface(SessionInterface):
     """The default session interface that stores sessions in signed cookies
     throught the :mod:`itsdangerous` module.
@@ -200,33 +433,121 @@ class SecureCookieSessionInterface(SessionInterface):
     salt = 'cookie-session'
     digest_method = staticmethod(hashlib.sha1)
     key_derivation = 'hmac'
-    serializer = session_json_serializer
+    serializer = compact_session_serializer
+    serializer_class = SessionSigningSerializer
     session_class = SecureCookieSession
 
-    def get_signing_serializer(self, app):
-        if not app.secret_key:
-            return None
+    #: unchanged permanent sessions are only signed and sent again after
+    #: this fraction of the session lifetime passed.
+    refresh_after = 0.5
+
+    def __init__(self):
+        # app -> (secret keys, serializers) so that serializers are only
+        # created again after the secret keys changed.
+        self._serializers = WeakKeyDictionary()
+
+    def get_secret_keys(self, app):
+        """Returns a tuple of the secret keys that are accepted for the
+        session cookie.  The first key is used to sign new cookies.  This
+        is the ``SECRET_KEY`` or, if that is not set, the last key from
+        ``SECRET_KEYS``.  The remaining keys from ``SECRET_KEYS`` (a list
+        of keys, oldest first) are only used to verify existing cookies,
+        newest first.
+        """
+        keys = list(app.config.get('SECRET_KEYS') or ())
+        if app.secret_key:
+            keys.append(app.secret_key)
+        rv = []
+        for key in reversed(keys):
+            if key and key not in rv:
+                rv.append(key)
+        return tuple(rv)
+
+    def get_serializers(self, app):
+        """Returns one signing serializer per secret key in the order of
+        :meth:`get_secret_keys`.  They are cached per application and only
+        created again after the secret keys changed.
+        """
+        keys = self.get_secret_keys(app)
+        cached = self._serializers.get(app)
+        if cached is not None and cached[0] == keys:
+            return cached[1]
         signer_kwargs = dict(
             key_derivation=self.key_derivation,
             digest_method=self.digest_method
         )
-        return URLSafeTimedSerializer(app.secret_key, salt=self.salt,
-                                      serializer=self.serializer,
-                                      signer_kwargs=signer_kwargs)
+        rv = tuple(self.serializer_class(key, salt=self.salt,
+                                         serializer=self.serializer,
+                                         signer_kwargs=signer_kwargs)
+                   for key in keys)
+        self._serializers[app] = (keys, rv)
+        return rv
+
+    def get_signing_serializer(self, app):
+        serializers = self.get_serializers(app)
+        if serializers:
+            return serializers[0]
 
     def open_session(self, app, request):
-        s = self.get_signing_serializer(app)
-        if s is None:
+        serializers = self.get_serializers(app)
+        if not serializers:
             return None
         val = request.cookies.get(app.session_cookie_name)
         if not val:
             return self.session_class()
         max_age = total_seconds(app.permanent_session_lifetime)
-        try:
-            data = s.loads(val, max_age=max_age)
-            return self.session_class(data)
-        except BadSignature:
-            return self.session_class()
+        for index, s in enumerate(serializers):
+            try:
+                payload, timestamp = s.loads_payload(val, max_age=max_age)
+            except SignatureExpired:
+                break
+            except BadSignature:
+                continue
+            try:
+                data = self.serializer.loads(payload)
+            except ValueError as e:
+                raise BadPayload('Could not load the payload',
+                                 original_error=e)
+            rv = self.session_class(data)
+            rv.payload = payload
+            rv.issued_at = calendar.timegm(timestamp.utctimetuple())
+            rv.key_index = index
+            return rv
+        return self.session_class()
+
+    def get_payload(self, session):
+        """Returns the session serialized like in the cookie, but before it
+        is compressed and signed.
+        """
+        payload = self.serializer.dumps(dict(session))
+        if isinstance(payload, text_type):
+            payload = payload.encode('utf-8')
+        return payload
+
+    def session_changed(self, session):
+        """Tells if the content of a session differs from the cookie it
+        was loaded from.  Unlike :attr:`~SessionMixin.modified` this also
+        sees changes to mutable values in the session and ignores values
+        that were set to what they already were.
+        """
+        if session.payload is None:
+            return session.modified
+        return self.get_payload(session) != session.payload
+
+    def should_set_cookie(self, app, session):
+        # cookies verified with an older key are signed with the current
+        # one, so that the old keys can be retired.
+        if session.key_index:
+            return True
+        if self.session_changed(session):
+            return True
+        if not (app.config['SESSION_REFRESH_EACH_REQUEST'] and
+                session.permanent):
+            return False
+        if session.issued_at is None:
+            return True
+        lifetime = total_seconds(app.permanent_session_lifetime)
+        return time() - session.issued_at >= lifetime * self.refresh_after
     
     def save_session(self, app, session, response):
         domain = self.get_cookie_domain(app)
@@ -247,3 +568,235 @@ class SecureCookieSessionInterface(SessionInterface):
         response.set_cookie(app.session_cookie_name, val,
                             expires=expires, httponly=httponly,
                             domain=domain, path=path, secure=secure)
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Baseclass for sessions that are kept by a :class:`SessionStore`.
+    Only the session id in :attr:`sid` is sent to the client.
+    """
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class SessionStore(object):
+    """Baseclass for the storage backends of the
+    :class:`ServerSideSessionInterface`.  Session data is passed in and out
+    as serialized strings.  Expired sessions are removed by a background
+    thread every :attr:`sweep_interval` seconds, which is started the first
+    time a session is stored in a process.
+    """
+
+    #: the number of seconds between two sweeps for expired sessions.
+    #: If this is `None` no background thread is started.
+    sweep_interval = 300
+
+    _sweeper_pid = None
+
+    def get(self, sid):
+        """Returns the data stored for the session id or `None` if there
+        is no such session or it expired.
+        """
+        raise NotImplementedError()
+
+    def set(self, sid, data, timeout):
+        """Stores the data for the session id for `timeout` seconds."""
+        raise NotImplementedError()
+
+    def touch(self, sid, timeout):
+        """Extends the lifetime of a session without rewriting it."""
+        raise NotImplementedError()
+
+    def delete(self, sid):
+        raise NotImplementedError()
+
+    def sweep(self):
+        """Removes all expired sessions."""
+        raise NotImplementedError()
+
+    def start_sweeper(self):
+        if self.sweep_interval is None or self._sweeper_pid == os.getpid():
+            return
+        self._sweeper_pid = os.getpid()
+        t = Thread(target=self._sweep_forever, name='flask-session-sweeper')
+        t.daemon = True
+        t.start()
+
+    def _sweep_forever(self):
+        while True:
+            sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                # a failed sweep (a locked database for example) is simply
+                # retried in the next round.
+                pass
+
+
+class MemorySessionStore(SessionStore):
+    """Keeps sessions in a bounded dictionary inside the process.  If more
+    than `maxsize` sessions are stored the least recently used ones are
+    dropped.  As every process has its own sessions this is only useful
+    for single process deployments and for testing.
+    """
+
+    def __init__(self, maxsize=10000):
+        self._cache = LRUCache(maxsize)
+
+    def get(self, sid):
+        return self._cache.get(sid)
+
+    def set(self, sid, data, timeout):
+        self._cache.set(sid, data, timeout)
+        self.start_sweeper()
+
+    def touch(self, sid, timeout):
+        data = self._cache.get(sid)
+        if data is not None:
+            self._cache.set(sid, data, timeout)
+
+    def delete(self, sid):
+        self._cache.delete(sid)
+
+    def sweep(self):
+        self._cache.sweep()
+
+
+class SQLiteSessionStore(SessionStore):
+    """Keeps sessions in a SQLite database file.  SQLite takes care of the
+    locking so the file can be shared by all processes on a machine.  Use
+    :meth:`for_app` to put the database into the instance folder::
+
+        app.session_interface = ServerSideSessionInterface(
+            SQLiteSessionStore.for_app(app))
+
+    :param path: the filename of the database.
+    :param timeout: how many seconds to wait for a lock held by another
+                    process.
+    """
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = local()
+
+    @classmethod
+    def for_app(cls, app, filename='sessions.sqlite', **kwargs):
+        return cls(os.path.join(app.instance_path, filename), **kwargs)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        conn = sqlite3.connect(self.path, timeout=self.timeout,
+                               isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS sessions ('
+                     'sid TEXT PRIMARY KEY, data TEXT, expires REAL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires '
+                     'ON sessions (expires)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, sid):
+        row = self._connect().execute(
+            'SELECT data FROM sessions WHERE sid = ? AND expires > ?',
+            (sid, time())).fetchone()
+        if row is not None:
+            return row[0]
+
+    def set(self, sid, data, timeout):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO sessions (sid, data, expires) '
+            'VALUES (?, ?, ?)', (sid, data, time() + timeout))
+        self.start_sweeper()
+
+    def touch(self, sid, timeout):
+        self._connect().execute(
+            'UPDATE sessions SET expires = ? WHERE sid = ?',
+            (time() + timeout, sid))
+
+    def delete(self, sid):
+        self._connect().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def sweep(self):
+        self._connect().execute('DELETE FROM sessions WHERE expires <= ?',
+                                (time(),))
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """A session interface that keeps the session data in a
+    :class:`SessionStore` and only sends a random session id to the
+    client.  Session data is only written when the session was modified.
+    If no store is given sessions are kept in memory::
+
+        app.session_interface = ServerSideSessionInterface()
+    """
+    serializer = compact_session_serializer
+    session_class = ServerSideSession
+
+    #: the number of random bytes in a session id.
+    sid_bytes = 20
+
+    def __init__(self, store=None):
+        if store is None:
+            store = MemorySessionStore()
+        self.store = store
+
+    def generate_sid(self):
+        return binascii.hexlify(os.urandom(self.sid_bytes)).decode('ascii')
+
+    def get_session_timeout(self, app):
+        return total_seconds(app.permanent_session_lifetime)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.session_cookie_name)
+        if sid and len(sid) == self.sid_bytes * 2:
+            data = self.store.get(sid)
+            if data is not None:
+                try:
+                    return self.session_class(self.serializer.loads(data),
+                                              sid=sid)
+                except ValueError:
+                    pass
+        return self.session_class(sid=self.generate_sid(), new=True)
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified:
+                if not session.new:
+                    self.store.delete(session.sid)
+                response.delete_cookie(app.session_cookie_name,
+                                       domain=domain, path=path)
+            return
+
+        timeout = self.get_session_timeout(app)
+        if session.modified:
+            self.store.set(session.sid, self.serializer.dumps(dict(session)),
+                           timeout)
+        elif self.should_set_cookie(app, session):
+            self.store.touch(session.sid, timeout)
+        else:
+            return
+
+        httponly = self.get_cookie_httponly(app)
+        secure = self.get_cookie_secure(app)
+        expires = self.get_expiration_time(app, session)
+        response.set_cookie(app.session_cookie_name, session.sid,
+                            expires=expires, httponly=httponly,
+                            domain=domain, path=path, secure=secure)
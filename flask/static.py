@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.static
+    ~~~~~~~~~~~~
+
+    Fingerprinted names for static files so that they can be cached by
+    browsers forever.
+"""
+
+import io
+import os
+import gzip
+import shutil
+import hashlib
+import tempfile
+import posixpath
+from time import time
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from . import json
+from ._compat import iteritems, text_type
+
+
+def _hash_file(path, length):
+    h = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            h.update(block)
+    return h.hexdigest()[:length]
+
+
+def fingerprint_filename(filename, digest):
+    """Inserts the digest before the extension of a filename:
+    ``css/app.css`` becomes ``css/app.<digest>.css``.
+    """
+    dirname, basename = posixpath.split(filename)
+    name, ext = posixpath.splitext(basename)
+    if not name:
+        name, ext = ext, ''
+    return posixpath.join(dirname, '%s.%s%s' % (name, digest, ext))
+
+
+class StaticManifest(object):
+    """Maps the files of static endpoints to names that contain a hash of
+    their content.  :func:`~flask.url_for` links to the fingerprinted names
+    and :meth:`~flask.Flask.send_static_file` serves them with headers that
+    allow caching them forever, as a changed file gets a new name.
+
+    :param files: a dict that maps endpoints to dicts of filenames and
+                  their fingerprinted names.
+    :param built: the time the files were hashed at, if the manifest was
+                  built in this process.
+    """
+
+    #: the number of hex digits of the content hash used in names.
+    hash_length = 12
+
+    #: the max age of responses for fingerprinted names (one year).
+    max_age = 31536000
+
+    def __init__(self, files=None, built=None):
+        self.files = files or {}
+        self.built = built
+        self._originals = dict(
+            (endpoint, dict((v, k) for k, v in iteritems(mapping)))
+            for endpoint, mapping in iteritems(self.files))
+
+    @classmethod
+    def build(cls, folders, threads=None):
+        """Builds a manifest from ``(endpoint, folder)`` pairs.  The files
+        are hashed in parallel by a pool of `threads` threads.
+        """
+        built = time()
+        jobs = []
+        for endpoint, folder in folders:
+            for dirpath, dirnames, filenames in os.walk(folder):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    name = os.path.relpath(path, folder)
+                    jobs.append((endpoint, name.replace(os.path.sep, '/'),
+                                 path))
+
+        def fingerprint(job):
+            endpoint, name, path = job
+            return endpoint, name, fingerprint_filename(
+                name, _hash_file(path, cls.hash_length))
+
+        pool = ThreadPool(threads)
+        try:
+            results = pool.map(fingerprint, jobs)
+        finally:
+            pool.close()
+            pool.join()
+        files = {}
+        for endpoint, name, fingerprinted in results:
+            files.setdefault(endpoint, {})[name] = fingerprinted
+        return cls(files, built)
+
+    @classmethod
+    def load(cls, filename):
+        """Loads a manifest that was written with :meth:`save`."""
+        with io.open(filename, 'r', encoding='utf-8') as f:
+            return cls(json.load(f)['files'])
+
+    def save(self, filename):
+        """Writes the manifest to a JSON file."""
+        with io.open(filename, 'w', encoding='utf-8') as f:
+            f.write(text_type(json.dumps({'files': self.files}, indent=2,
+                                         sort_keys=True)))
+
+    def get(self, endpoint, filename):
+        """Returns the fingerprinted name of a file or the filename if it
+        is not in the manifest.
+        """
+        return self.files.get(endpoint, {}).get(filename, filename)
+
+    def is_current(self, mtime):
+        """Checks if a file with the modification time `mtime` still has
+        the content that was hashed.  Files of loaded manifests are
+        assumed to be current as their modification time is not known
+        to be related to the time the manifest was built.
+        """
+        return self.built is None or mtime <= self.built
+
+    def resolve(self, endpoint, filename):
+        """Returns the original filename for a fingerprinted name or `None`
+        if `filename` is not a fingerprinted name.
+        """
+        return self._originals.get(endpoint, {}).get(filename)
+
+    def __len__(self):
+        return sum(len(x) for x in self.files.values())
+
+    def __repr__(self):
+        return '<%s %d files>' % (self.__class__.__name__, len(self))
+
+
+#: the extensions of files that are worth compressing.
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.json', '.map', '.svg', '.html',
+                           '.htm', '.txt', '.xml', '.ico', '.ttf', '.eot')
+
+
+def _write_sidecar(filename, data, source):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename), prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # same permissions and modification time as the source file, the
+        # sidecar counts as up to date as long as it is not older.
+        shutil.copystat(source, tmp)
+        if os.name == 'nt' and os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmp, filename)
+    except:
+        os.remove(tmp)
+        raise
+
+
+def _gzip(data):
+    buf = io.BytesIO()
+    # a fixed mtime makes the output the same for the same input
+    f = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0)
+    try:
+        f.write(data)
+    finally:
+        f.close()
+    return buf.getvalue()
+
+
+def _compress_file(args):
+    path, encodings = args
+    with open(path, 'rb') as f:
+        data = f.read()
+    mtime = os.path.getmtime(path)
+    rv = []
+    for ext in encodings:
+        sidecar = path + ext
+        try:
+            if os.path.getmtime(sidecar) >= mtime:
+                continue
+        except OSError:
+            pass
+        if ext == '.br':
+            compressed = brotli.compress(data)
+        else:
+            compressed = _gzip(data)
+        if len(compressed) >= len(data):
+            continue
+        _write_sidecar(sidecar, compressed, path)
+        rv.append(sidecar)
+    return rv
+
+
+def precompress_static_folder(folder, extensions=COMPRESSIBLE_EXTENSIONS,
+                              min_size=1024, processes=None):
+    """Writes ``.gz`` (and ``.br`` if the brotli library is installed)
+    files next to the files in `folder` so that
+    :func:`~flask.send_from_directory` can send them to clients that accept
+    these encodings.  Only files with one of the `extensions` and at least
+    `min_size` bytes are compressed, compressed files that are not smaller
+    are not written and up-to-date ones are skipped.  The files are
+    compressed by a pool of `processes` processes.  Returns the names of
+    the files that were written.
+    """
+    encodings = ['.gz']
+    if brotli is not None:
+        encodings.append('.br')
+    jobs = []
+    for dirpath, dirnames, filenames in os.walk(folder):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if filename.endswith(extensions) and \
+               os.path.getsize(path) >= min_size:
+                jobs.append((path, encodings))
+    if not jobs:
+        return []
+    pool = Pool(processes)
+    try:
+        results = pool.map(_compress_file, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    return [sidecar for result in results for sidecar in result]
@@ -6,18 +6,39 @@
     Implements the bridge to Jinja2.
 """
 
+import os
+import errno
+import tempfile
 import posixpath
+from time import time
+from threading import Lock
+from collections import deque
 
 from jinja2 import BaseLoader, Environment as BaseEnvironment, \
-     TemplateNotFound
+     TemplateNotFound, FileSystemBytecodeCache as _FileSystemBytecodeCache, \
+     Markup
+from jinja2.bccache import Bucket
+from jinja2.runtime import Context as BaseContext
+from jinja2.utils import missing
+from jinja2.ext import Extension
+from jinja2 import nodes
 
-from .globals import _request_ctx_stack, _app_ctx_stack
-from .signals import template_rendered
+from .globals import _request_ctx_stack, _app_ctx_stack, session
+from .signals import template_rendered, _signals
+from .helpers import stream_with_context, LRUCache
+from ._compat import iteritems, itervalues
+
+
+#: sent for every ``{% cache %}`` block with the `key` of the fragment and
+#: whether it was a `hit`.
+template_fragment_cache_lookup = _signals.signal(
+    'template-fragment-cache-lookup')
 
 
 def _default_template_ctx_processor():
     """Default template context processor. Injects `request`,
-    `session` and `g`.
+    `session` and `g`.  The session is injected as proxy so that it is
+    only loaded if the template uses it.
     """
     reqctx = _request_ctx_stack.top
     appctx = _app_ctx_stack.top
@@ -26,10 +47,85 @@ def _default_template_ctx_processor():
         rv['g'] = appctx.g
     if reqctx is not None:
         rv['request'] = reqctx.request
-        rv['session'] = reqctx.session
+        rv['session'] = session
     return rv
 
 
+class LazyContextProcessor(object):
+    """A context processor registered with
+    :meth:`~flask.Flask.lazy_context_processor`.  It is only called if a
+    template looks up one of the `names` it provides, at most once per
+    rendered template.
+    """
+
+    def __init__(self, func, names):
+        self.func = func
+        self.names = names
+
+    def __call__(self):
+        return self.func()
+
+    def bind(self):
+        """Returns placeholders for the `names` that share a single call
+        of the processor.
+        """
+        call = _LazyCall(self.func)
+        return [(name, _LazyContextValue(call, name)) for name in self.names]
+
+
+class _LazyCall(object):
+    __slots__ = ('func', 'rv')
+
+    def __init__(self, func):
+        self.func = func
+        self.rv = None
+
+    def __call__(self):
+        if self.rv is None:
+            self.rv = self.func()
+        return self.rv
+
+
+class _LazyContextValue(object):
+    __slots__ = ('call', 'name')
+
+    def __init__(self, call, name):
+        self.call = call
+        self.name = name
+
+    def resolve(self):
+        return self.call().get(self.name, missing)
+
+    def __repr__(self):
+        return '<lazy context value %r>' % self.name
+
+
+class Context(BaseContext):
+    """The template context that resolves the values of lazy context
+    processors when they are looked up for the first time.
+    """
+
+    def _resolve_lazy(self, key, value):
+        if isinstance(value, _LazyContextValue):
+            value = value.resolve()
+            if value is not missing:
+                if key in self.vars:
+                    self.vars[key] = value
+                else:
+                    self.parent[key] = value
+        return value
+
+    def resolve_or_missing(self, key):
+        return self._resolve_lazy(key,
+            BaseContext.resolve_or_missing(self, key))
+
+    def resolve(self, key):
+        rv = self._resolve_lazy(key, BaseContext.resolve(self, key))
+        if rv is missing:
+            return self.environment.undefined(name=key)
+        return rv
+
+
 class Environment(BaseEnvironment):
     """Works like a regular Jinja2 environment but has some additional
     knowledge of how Flask's blueprint works so that it can prepend the 
@@ -41,20 +137,199 @@ class Environment(BaseEnvironment):
             options['loader'] = app.create_global_jinja_loader()
         BaseEnvironment.__init__(self, **options)
         self.app = app
+        self.context_class = Context
+
+    def _load_template(self, name, globals):
+        stats = self.app.template_stats
+        if stats is not None:
+            stats.record_lookup()
+        return BaseEnvironment._load_template(self, name, globals)
+
+
+class FileSystemBytecodeCache(_FileSystemBytecodeCache):
+    """A bytecode cache that stores compiled templates in a directory that
+    can be shared by all processes of an application.  Entries are keyed by
+    the template name, its filename and the checksum of its source, so an
+    entry is never used for a different version of a template.  Entries
+    are written to a temporary file first and then renamed so that other
+    processes never see partially written files.
+    """
+
+    def __init__(self, directory, pattern='__flask_jinja_%s.cache'):
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        _FileSystemBytecodeCache.__init__(self, directory, pattern)
+
+    def get_bucket(self, environment, name, filename, source):
+        checksum = self.get_source_checksum(source)
+        key = self.get_cache_key(name, '%s|%s' % (filename or '', checksum))
+        bucket = Bucket(environment, key, checksum)
+        self.load_bytecode(bucket)
+        return bucket
+
+    def dump_bytecode(self, bucket):
+        filename = self._get_cache_filename(bucket)
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                bucket.write_bytecode(f)
+            if os.name == 'nt' and os.path.exists(filename):
+                os.remove(filename)
+            os.rename(tmp, filename)
+        except (IOError, OSError):
+            # the template was compiled anyways, failing to store it
+            # only means that it is compiled again next time.
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+class FragmentCacheExtension(Extension):
+    """Adds a ``{% cache key, timeout %}`` block that stores the rendered
+    body in the application's :attr:`~flask.Flask.fragment_cache`::
+
+        {% cache ('nav', current_category.id), 600 %}
+            {{ render_navigation(current_category) }}
+        {% endcache %}
+
+    The key is any hashable expression (lists are converted to tuples) and
+    is shared between all templates.  The timeout is optional and given in
+    seconds, without it the ``FRAGMENT_CACHE_TIMEOUT`` is used.  Fragments
+    are removed with :meth:`~flask.Flask.invalidate_template_fragment`.
+    """
+    tags = set(['cache'])
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.ContextReference(), parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache_fragment', args),
+                               [], [], body).set_lineno(lineno)
+
+    def _cache_fragment(self, context, key, timeout, caller):
+        if isinstance(key, list):
+            key = tuple(key)
+        app = self.environment.app
+        cache = app.fragment_cache
+        rv = cache.get(key)
+        hit = rv is not None
+        if not hit:
+            rv = caller()
+            cache.set(key, rv, timeout)
+        elif context.eval_ctx.autoescape:
+            # stores might return plain strings for the stored markup
+            rv = Markup(rv)
+        template_fragment_cache_lookup.send(app, key=key, hit=hit)
+        return rv
 
 
 class DispatchingJinjaLoader(BaseLoader):
     """A loader that looks for templates in the application and all
     the blueprint folders.
+
+    On first use it builds an index that maps every template name the
+    loaders list to the loader that provides it, in the usual priority
+    order, so that a lookup does not have to try every blueprint.  Names
+    that are not in the index are looked up the slow way once and the
+    result is remembered, for misses up to :attr:`max_missing` names.  The
+    index is rebuilt after blueprints were registered, when the
+    :class:`~flask.watcher.TemplateWatcher` reports added or removed files
+    and, with auto reloading enabled, when it is older than
+    :attr:`index_refresh_interval`.  If one of the loaders cannot list its
+    templates no index is used.
     """
 
+    #: how old the index has to be in seconds before a lookup rebuilds it
+    #: while templates are auto reloaded.
+    index_refresh_interval = 2.0
+
+    #: the number of names of missing templates that are remembered.
+    max_missing = 1024
+
     def __init__(self, app):
         self.app = app
+        self._index_lock = Lock()
+        self._index = None
+
+    def clear_index(self):
+        """Forgets the template index and the remembered misses."""
+        self._index = None
+
+    def load(self, environment, name, globals=None):
+        stats = self.app.template_stats
+        if stats is None:
+            return BaseLoader.load(self, environment, name, globals)
+        start = time()
+        try:
+            return BaseLoader.load(self, environment, name, globals)
+        finally:
+            stats.record_load(name, time() - start)
+
+    def _build_index(self):
+        index = {}
+        for loader, _ in self._iter_loaders(None):
+            try:
+                names = loader.list_templates()
+            except TypeError:
+                index = None
+                break
+            for name in names:
+                index.setdefault(name, loader)
+        return index, LRUCache(self.max_missing), time(), \
+            len(self.app.blueprints)
+
+    def _get_index(self):
+        rv = self._index
+        if rv is None or rv[3] != len(self.app.blueprints):
+            with self._index_lock:
+                rv = self._index
+                if rv is None or rv[3] != len(self.app.blueprints):
+                    rv = self._index = self._build_index()
+        return rv
 
     def get_source(self, environment, template):
+        index, missing, built, _ = self._get_index()
+        if index is None:
+            return self._find_source(environment, template)[1]
+        if environment.auto_reload and \
+           time() - built > self.index_refresh_interval:
+            # templates might have been added or removed since, even ones
+            # that shadow templates in the index.
+            self.clear_index()
+            index, missing, built, _ = self._get_index()
+
+        loader = index.get(template)
+        if loader is not None:
+            try:
+                return loader.get_source(environment, template)
+            except TemplateNotFound:
+                pass
+        if template in missing:
+            raise TemplateNotFound(template)
+
+        try:
+            loader, rv = self._find_source(environment, template)
+        except TemplateNotFound:
+            missing.set(template, True)
+            raise
+        index[template] = loader
+        return rv
+
+    def _find_source(self, environment, template):
         for loader, local_name in self._iter_loaders(template):
             try:
-                return loader.get_source(environment, local_name)
+                return loader, loader.get_source(environment, local_name)
             except TemplateNotFound:
                 pass
 
@@ -65,18 +340,18 @@ class DispatchingJinjaLoader(BaseLoader):
         if loader is not None:
             yield loader, template
 
-        for blueprint in self.app.blueprints.itervalues():
+        for blueprint in itervalues(self.app.blueprints):
             loader = blueprint.jinja_loader
             if loader is not None:
                 yield loader, template
-    
+
     def list_templates(self):
         result = set()
         loader = self.app.jinja_loader
         if loader is not None:
             result.update(loader.list_templates())
 
-        for name, blueprint in self.app.blueprints.iteritems():
+        for name, blueprint in iteritems(self.app.blueprints):
             loader = blueprint.jinja_loader
             
             if loader is not None:
@@ -86,9 +361,133 @@ class DispatchingJinjaLoader(BaseLoader):
         return list(result)
 
 
+class TemplateStats(object):
+    """Collects render and load times per template name and how often the
+    template cache of the environment was hit.  The application keeps one
+    in :attr:`~flask.Flask.template_stats` if ``TEMPLATE_STATS`` is
+    enabled.  Percentiles are computed over the last `window` renders of
+    each template.  Templates created from strings are recorded as
+    ``'<string>'``.
+
+    The template cache counts every template lookup as a hit unless the
+    template had to be loaded by the application's loader.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.lookups = 0
+        self._templates = {}
+        self._lock = Lock()
+
+    def _get(self, name):
+        if name is None:
+            name = '<string>'
+        rv = self._templates.get(name)
+        if rv is None:
+            rv = self._templates[name] = {
+                'renders': 0,
+                'render_time': 0.0,
+                'durations': deque(maxlen=self.window),
+                'loads': 0,
+                'load_time': 0.0,
+            }
+        return rv
+
+    def record_lookup(self):
+        with self._lock:
+            self.lookups += 1
+
+    def record_load(self, name, duration):
+        with self._lock:
+            record = self._get(name)
+            record['loads'] += 1
+            record['load_time'] += duration
+
+    def record_render(self, name, duration):
+        with self._lock:
+            record = self._get(name)
+            record['renders'] += 1
+            record['render_time'] += duration
+            record['durations'].append(duration)
+
+    @property
+    def misses(self):
+        """How often a template was not found in the template cache."""
+        with self._lock:
+            return sum(x['loads'] for x in self._templates.values())
+
+    @property
+    def hits(self):
+        """How often a template was found in the template cache."""
+        return max(self.lookups - self.misses, 0)
+
+    def get(self, name):
+        """Returns the statistics of a template as dict with the number
+        of `renders`, the cumulative `render_time`, the `mean`, `p50`,
+        `p90` and `p99` render times as well as the number of `loads` and
+        the cumulative `load_time` (loading and compiling) in seconds.
+        """
+        with self._lock:
+            record = self._get(name)
+            durations = sorted(record['durations'])
+            rv = dict((key, value) for key, value in record.items()
+                      if key != 'durations')
+        rv['mean'] = 0.0
+        if rv['renders']:
+            rv['mean'] = rv['render_time'] / rv['renders']
+        for percentile in 50, 90, 99:
+            value = 0.0
+            if durations:
+                index = int(len(durations) * percentile / 100.0 + 0.5) - 1
+                value = durations[min(max(index, 0), len(durations) - 1)]
+            rv['p%d' % percentile] = value
+        return rv
+
+    def report(self):
+        """Returns the statistics of all templates sorted by cumulative
+        render time, slowest first, as a list of ``(name, stats)``
+        tuples.
+        """
+        with self._lock:
+            names = list(self._templates)
+        rv = [(name, self.get(name)) for name in names]
+        rv.sort(key=lambda x: x[1]['render_time'], reverse=True)
+        return rv
+
+    def clear(self):
+        with self._lock:
+            self.lookups = 0
+            self._templates.clear()
+
+
+def _signal_context(context):
+    """Returns the context for :data:`template_rendered` with the values
+    of lazy context processors resolved.  Processors that the template
+    did not use are only called if the signal has receivers.
+    """
+    if not getattr(template_rendered, 'receivers', None):
+        return context
+    rv = {}
+    for key, value in iteritems(context):
+        if isinstance(value, _LazyContextValue):
+            value = value.resolve()
+            if value is missing:
+                continue
+        rv[key] = value
+    return rv
+
+
 def _render(template, context, app):
     """Renders the template and fires the signal"""
-    rv = template.render(context)
+    stats = app.template_stats
+    if stats is None:
+        rv = template.render(context)
+    else:
+        start = time()
+        rv = template.render(context)
+        stats.record_render(template.name, time() - start)
+    template_rendered.send(app, template=template,
+                           context=_signal_context(context))
     return rv
 
 
@@ -118,3 +517,70 @@ def render_template_string(source, **context):
     ctx.app.update_template_context(context)
     return _render(ctx.app.jinja_env.from_string(source), 
                    context, ctx.app)
+
+
+def _stream(template, context, app):
+    """Streams the template and fires the signal once it is done"""
+    def generate():
+        stream = template.stream(context)
+        buffer_size = app.config['TEMPLATE_STREAM_BUFFER_SIZE']
+        if buffer_size:
+            stream.enable_buffering(buffer_size)
+        stats = app.template_stats
+        if stats is None:
+            for chunk in stream:
+                yield chunk
+        else:
+            # only the time spent rendering is recorded, not the time
+            # the server needs to send the chunks.
+            duration = 0.0
+            while 1:
+                start = time()
+                chunk = next(stream, None)
+                duration += time() - start
+                if chunk is None:
+                    break
+                yield chunk
+            stats.record_render(template.name, duration)
+        template_rendered.send(app, template=template,
+                               context=_signal_context(context))
+    return stream_with_context(generate())
+
+
+def stream_template(template_name_or_list, **context):
+    """Renders a template like :func:`render_template` but returns an
+    iterator that yields the output while the template is rendered, so
+    the response can start before the whole page exists::
+
+        @app.route('/report')
+        def report():
+            return Response(stream_template('report.html', rows=rows()))
+
+    The request context is kept around until the template is finished.
+    Small chunks are collected into ``TEMPLATE_STREAM_BUFFER_SIZE`` parts
+    before they are sent, set it to `0` to send every part immediately.
+
+    :param template_name_or_list: the name of the template to be
+                                  rendered, or an iterable with template names
+                                  the first one existing will be rendered
+    :param context: the variables that should be available in the
+                    context of the template.
+    """
+    ctx = _app_ctx_stack.top
+    ctx.app.update_template_context(context)
+    return _stream(ctx.app.jinja_env.get_or_select_template(
+                   template_name_or_list), context, ctx.app)
+
+
+def stream_template_string(source, **context):
+    """Streams a template from the given template source string like
+    :func:`stream_template`.
+
+    :param source: the sourcecode of the template to be rendered
+    :param context: the variables that should be available in the
+                    context of the template.
+    """
+    ctx = _app_ctx_stack.top
+    ctx.app.update_template_context(context)
+    return _stream(ctx.app.jinja_env.from_string(source),
+                   context, ctx.app)
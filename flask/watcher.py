@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.watcher
+    ~~~~~~~~~~~~~
+
+    Watches the template folders for changes and removes changed templates
+    from the template cache, so that templates do not have to be checked
+    for changes each time they are used.
+"""
+
+import os
+import sys
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from threading import Thread, Event
+
+
+# inotify event masks, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+_watch_mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+    IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+_event_header = struct.Struct('iIII')
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def _walk_files(folder):
+    for dirpath, dirnames, filenames in os.walk(folder, followlinks=True):
+        for filename in filenames:
+            yield os.path.join(dirpath, filename)
+
+
+class InotifyBackend(object):
+    """Watches folders with the Linux inotify API.  Calls `callback` with
+    the paths that changed and whether files were added or removed.
+    """
+
+    def __init__(self, folders, callback):
+        self.libc = _load_libc()
+        if self.libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.callback = callback
+        self.watches = {}
+        for folder in folders:
+            self._add_tree(folder)
+
+    def _add_watch(self, path):
+        wd = self.libc.inotify_add_watch(
+            self.fd, path.encode(sys.getfilesystemencoding()), _watch_mask)
+        if wd >= 0:
+            self.watches[wd] = path
+
+    def _add_tree(self, folder):
+        for dirpath, dirnames, filenames in os.walk(folder, followlinks=True):
+            self._add_watch(dirpath)
+
+    def run(self, stop):
+        try:
+            while not stop.is_set():
+                if not select.select([self.fd], [], [], 1.0)[0]:
+                    continue
+                self._process(os.read(self.fd, 65536))
+        finally:
+            os.close(self.fd)
+
+    def _process(self, data):
+        changed = []
+        structural = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _event_header.unpack_from(data, offset)
+            offset += _event_header.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                self.callback(None, True)
+                return
+            folder = self.watches.get(wd)
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if folder is None:
+                continue
+            path = folder
+            if name:
+                path = os.path.join(folder, name.decode(
+                    sys.getfilesystemencoding()))
+            if mask & (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO |
+                       IN_DELETE_SELF | IN_MOVE_SELF):
+                structural = True
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # files might have been created before the watch
+                    self._add_tree(path)
+                    changed.extend(_walk_files(path))
+                else:
+                    changed.append(path + os.path.sep)
+            else:
+                changed.append(path)
+        if changed:
+            self.callback(changed, structural)
+
+
+class PollingBackend(object):
+    """Checks the modification times of all files in the folders every
+    `interval` seconds.  Used where inotify is not available.
+    """
+
+    def __init__(self, folders, callback, interval=1.0):
+        self.folders = folders
+        self.callback = callback
+        self.interval = interval
+        self.mtimes = self._scan()
+
+    def _scan(self):
+        rv = {}
+        for folder in self.folders:
+            for filename in _walk_files(folder):
+                try:
+                    st = os.stat(filename)
+                except OSError:
+                    continue
+                rv[filename] = (st.st_mtime, st.st_size)
+        return rv
+
+    def run(self, stop):
+        while not stop.wait(self.interval):
+            mtimes = self._scan()
+            changed = [filename for filename, value in mtimes.items()
+                       if self.mtimes.get(filename) != value]
+            removed = [filename for filename in self.mtimes
+                       if filename not in mtimes]
+            added = len(mtimes) != len(self.mtimes) - len(removed)
+            self.mtimes = mtimes
+            if changed or removed:
+                self.callback(changed + removed, bool(removed or added))
+
+
+class TemplateWatcher(object):
+    """Watches the template folders of an application and its blueprints
+    and removes changed templates from the template cache of `env`.  While
+    it runs, the environment's `auto_reload` is disabled so that rendering
+    does not check the files for changes anymore.  Only loaders with a
+    `searchpath` (like the default
+    :class:`~jinja2.FileSystemLoader`) can be watched, if any other loader
+    is in use the templates keep being checked.
+
+    :param app: the application.
+    :param env: the Jinja environment whose cache is updated.
+    :param use_inotify: use inotify if it is available.  Otherwise the
+                        folders are polled every `interval` seconds.
+    """
+
+    def __init__(self, app, env, use_inotify=True, interval=1.0):
+        self.app = app
+        self.env = env
+        self.use_inotify = use_inotify
+        self.interval = interval
+        self.backend = None
+        self._folders = []
+        self._stop = Event()
+        self._thread = None
+
+    def get_folders(self):
+        """Returns the template folders to watch or `None` if one of the
+        loaders cannot be watched.
+        """
+        loaders = [self.app.jinja_loader]
+        loaders.extend(bp.jinja_loader for bp in self.app.blueprints.values())
+        rv = []
+        for loader in loaders:
+            if loader is None:
+                continue
+            searchpath = getattr(loader, 'searchpath', None)
+            if searchpath is None:
+                return None
+            rv.extend(os.path.abspath(x) for x in searchpath
+                      if os.path.isdir(x))
+        return rv
+
+    def start(self):
+        """Starts watching in a background thread.  Returns `False` if the
+        templates cannot be watched.
+        """
+        folders = self.get_folders()
+        if folders is None:
+            return False
+        self._folders = folders
+        self.backend = None
+        if self.use_inotify:
+            try:
+                self.backend = InotifyBackend(folders, self.templates_changed)
+            except OSError:
+                pass
+        if self.backend is None:
+            self.backend = PollingBackend(folders, self.templates_changed,
+                                          self.interval)
+        self.env.auto_reload = False
+        self._stop.clear()
+        self._thread = Thread(target=self.backend.run, args=(self._stop,))
+        self._thread.daemon = True
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Stops watching and enables the checks of `auto_reload` again."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.env.auto_reload = True
+
+    def get_template_names(self, paths):
+        """Returns the template names for changed paths.  Paths that end
+        with a separator stand for a whole folder.
+        """
+        rv = set()
+        for path in paths:
+            for folder in self._folders:
+                prefix = folder.rstrip(os.path.sep) + os.path.sep
+                if path.startswith(prefix):
+                    rv.add(path[len(prefix):].replace(os.path.sep, '/'))
+        return rv
+
+    def templates_changed(self, paths, structural):
+        """Called by the backend with the changed paths and whether files
+        were added or removed.  `paths` is `None` if the changes are not
+        known, in which case all templates are removed from the cache.
+        """
+        loader = self.env.loader
+        if structural and hasattr(loader, 'clear_index'):
+            loader.clear_index()
+        cache = self.env.cache
+        if cache is None:
+            return
+        if paths is None:
+            cache.clear()
+            return
+        names = self.get_template_names(paths)
+        folders = tuple(x for x in names if x.endswith('/'))
+        for key in list(cache.keys()):
+            # jinja2 uses the name or (weakref to loader, name) as key
+            name = key[1] if isinstance(key, tuple) else key
+            if name in names or name.startswith(folders):
+                try:
+                    del cache[key]
+                except KeyError:
+                    pass
@@ -5,9 +5,12 @@
 
     Implements the WSGI wrappers (request and response).
 """
+import re
+import codecs
 
 from werkzeug.wrappers import Request as RequestBase, Response as ResponseBase
-from werkzeug.exceptions import BadRequest
+from werkzeug.exceptions import BadRequest, UnsupportedMediaType, \
+     RequestEntityTooLarge
 
 from .debughelpers import accach_enctype_error_multidict
 from . import json
@@ -16,6 +19,8 @@ from .globals import _request_ctx_stack
 
 _missing = object()
 
+_json_whitespace = re.compile(r'[ \t\n\r]*')
+
 
 def _get_data(req, cache):
     getter = getattr(req, 'get_data', None)
@@ -77,6 +82,212 @@ class Request(RequestBase):
         if self.url_rule and '.' in self.url_rule.endpoint:
             return self.url_rule.endpoint.rsplit('.', 1)[0]
     
+    @property
+    def is_json(self):
+        """`True` if the mimetype is ``application/json`` or another
+        ``application/*+json`` type.
+        """
+        mt = self.mimetype
+        return mt == 'application/json' or \
+            (mt.startswith('application/') and mt.endswith('+json'))
+
+    @property
+    def json(self):
+        """The parsed JSON data or `None` if the mimetype is not JSON.
+        See :meth:`get_json`.
+        """
+        return self.get_json()
+
+    def _check_content_length(self):
+        max_length = self.max_content_length
+        if max_length is not None and self.content_length is not None \
+           and self.content_length > max_length:
+            raise RequestEntityTooLarge()
+
+    def get_json(self, force=False, silent=False, cache=True):
+        """Parses the body as JSON and returns it.  The body is parsed only
+        once per request unless `cache` is disabled.  Requests announcing a
+        body larger than ``MAX_CONTENT_LENGTH`` are rejected before anything
+        is read.  The bytes are passed to the JSON backend as they are, so
+        backends that parse bytes do not need a decoded copy.
+
+        :param force: ignore the mimetype and always try to parse JSON.
+        :param silent: return `None` if parsing fails.
+        :param cache: remember the parsed JSON for this request.
+        """
+        rv = getattr(self, '_parsed_json', _missing)
+        if rv is not _missing:
+            return rv
+        if not (force or self.is_json):
+            return None
+
+        self._check_content_length()
+        data = _get_data(self, cache)
+        charset = self.mimetype_params.get('charset')
+        try:
+            if charset is not None and \
+               codecs.lookup(charset).name != 'utf-8':
+                rv = json.loads(data, encoding=charset)
+            else:
+                rv = json.loads(data)
+        except (ValueError, LookupError) as e:
+            if silent:
+                rv = None
+            else:
+                rv = self.on_json_loading_failed(e)
+        if cache:
+            self._parsed_json = rv
+        return rv
+
+    def on_json_loading_failed(self, e):
+        """Called if parsing the JSON body fails.  The return value is used
+        as the result of :meth:`get_json`.  Raises a
+        :exc:`~werkzeug.exceptions.BadRequest` by default.
+        """
+        raise BadRequest('Failed to decode JSON object: %s' % e)
+
+    def iter_json(self, force=False, chunk_size=16384):
+        """Parses a body that is a top-level JSON array incrementally and
+        yields its items one at a time, so that only the item being parsed
+        has to be held in memory::
+
+            @app.route('/ingest', methods=['POST'])
+            def ingest():
+                for record in request.iter_json():
+                    store(record)
+                return '', 204
+
+        The body is read from :attr:`stream` in chunks of `chunk_size`
+        bytes and not cached.  Invalid JSON or reading more than
+        ``MAX_CONTENT_LENGTH`` bytes aborts with an error.
+        """
+        if not (force or self.is_json):
+            raise UnsupportedMediaType()
+        self._check_content_length()
+
+        ctx = _request_ctx_stack.top
+        provider = ctx.app.json_provider
+        charset = self.mimetype_params.get('charset') or 'utf-8'
+        try:
+            decoder = codecs.getincrementaldecoder(charset)()
+        except LookupError as e:
+            self.on_json_loading_failed(e)
+            return
+        max_length = self.max_content_length
+        cached = getattr(self, '_cached_data', None)
+        if cached is not None:
+            chunks = iter([cached])
+        else:
+            chunks = iter(lambda: self.stream.read(chunk_size), b'')
+
+        buf = u''
+        pos = 0
+        received = 0
+        eof = False
+        state = 'start'
+        while 1:
+            pos = _json_whitespace.match(buf, pos).end()
+            error = None
+            if pos < len(buf):
+                char = buf[pos]
+                pos += 1
+                if state == 'start':
+                    if char != u'[':
+                        error = ValueError('Expected a JSON array')
+                    state = 'first'
+                elif state == 'end':
+                    error = ValueError('Extra data after the JSON array')
+                elif char == u']' and state != 'value':
+                    state = 'end'
+                elif state == 'comma':
+                    if char != u',':
+                        error = ValueError('Expected "," or "]"')
+                    state = 'value'
+                else:
+                    pos -= 1
+                    try:
+                        item, end = provider.raw_decode(buf, pos)
+                    except ValueError as e:
+                        end = None
+                        if eof:
+                            error = e
+                    # a value is only complete once the next token was
+                    # read, as a number might continue in the next chunk.
+                    if end is not None and not eof:
+                        next_pos = _json_whitespace.match(buf, end).end()
+                        if next_pos == len(buf) or \
+                           buf[next_pos] not in u',]':
+                            end = None
+                    if end is not None:
+                        yield item
+                        state = 'comma'
+                        pos = end
+                        if pos > chunk_size:
+                            buf = buf[pos:]
+                            pos = 0
+                        continue
+                    buf, pos = buf[pos:], 0
+                if error is None and pos:
+                    continue
+            elif eof:
+                if state == 'end':
+                    return
+                error = ValueError('Unexpected end of the JSON array')
+
+            if error is not None:
+                self.on_json_loading_failed(error)
+                return
+
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+            else:
+                received += len(chunk)
+                if max_length is not None and received > max_length:
+                    raise RequestEntityTooLarge()
+            try:
+                buf += decoder.decode(chunk or b'', eof)
+            except ValueError as e:
+                self.on_json_loading_failed(e)
+                return
+
+    def get_payload(self, silent=False, cache=True):
+        """Decodes the request body with the payload codec registered for
+        the request's mimetype (see :attr:`~flask.Flask.payload_codecs`).
+        Raises :exc:`~werkzeug.exceptions.UnsupportedMediaType` if there
+        is no codec for the mimetype and
+        :exc:`~werkzeug.exceptions.BadRequest` if the body cannot be
+        decoded, unless `silent` is set in which case `None` is returned.
+
+        :param silent: return `None` instead of failing.
+        :param cache: remember the decoded payload for this request.
+        """
+        rv = getattr(self, '_cached_payload', _missing)
+        if rv is not _missing:
+            return rv
+
+        ctx = _request_ctx_stack.top
+        codec = None
+        if ctx is not None:
+            codec = ctx.app.payload_codecs.get(self.mimetype)
+        if codec is None:
+            if silent:
+                return None
+            raise UnsupportedMediaType()
+
+        try:
+            rv = codec.loads(_get_data(self, cache))
+        except (ValueError, TypeError, RuntimeError):
+            # third party decoders raise TypeError for unhashable map keys
+            # and RuntimeError (RecursionError) for deeply nested data.
+            if not silent:
+                raise BadRequest('Failed to decode the %s payload'
+                                 % codec.mimetype)
+            rv = None
+        if cache:
+            self._cached_payload = rv
+        return rv
+
     def _load_form_data(self):
         super(Request, self)._load_form_data()
 